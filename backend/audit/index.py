@@ -0,0 +1,95 @@
+from datetime import datetime
+
+from shared.http import HttpError, Request, Router, error
+from shared.pagination import page_params, stream_page
+from shared.queries import AuditEntry
+
+router = Router(auth=True)
+
+AUDIT_ROLES = ('owner', 'admin', 'accountant')
+# Весь журнал видит только owner; остальным — их собственные действия и записи об их модулях и интеграциях
+AUDIT_ALL_ROLES = ('owner',)
+
+OWN_SCOPE = """(
+    user_id = %s
+    OR (entity_type = 'integration' AND entity_id IN (SELECT id FROM integrations WHERE user_id = %s))
+    OR (entity_type = 'module' AND entity_id IN (SELECT id FROM modules WHERE owner_id = %s))
+)"""
+
+
+def serialize_entry(entry: AuditEntry) -> dict:
+    return {
+        'id': entry.id,
+        'createdAt': entry.created_at,
+        'userId': entry.user_id,
+        'role': entry.role,
+        'action': entry.action,
+        'entityType': entry.entity_type,
+        'entityId': entry.entity_id,
+        'changes': entry.changes,
+        'requestId': entry.request_id,
+        'ip': entry.ip
+    }
+
+
+def int_param(query: dict, name: str):
+    try:
+        return int(query[name])
+    except ValueError:
+        raise HttpError(400, f'Invalid {name}')
+
+
+def time_param(query: dict, name: str) -> datetime:
+    try:
+        return datetime.fromisoformat(query[name])
+    except ValueError:
+        raise HttpError(400, f'Invalid {name}')
+
+
+@router.route('GET')
+def list_entries(req: Request) -> dict:
+    '''Журнал изменений от новых к старым; фильтры userId, entityType[+entityId], from/to'''
+    if req.user['role'] not in AUDIT_ROLES:
+        return error(403, 'Access denied')
+
+    limit, after = page_params(req.query)
+    conditions, params = [], []
+    if req.user['role'] not in AUDIT_ALL_ROLES:
+        conditions.append(OWN_SCOPE)
+        params.extend([req.user['user_id']] * 3)
+    # Каждый фильтр ложится на свой индекс: (user_id, ...), (entity_type, entity_id, ...) или первичный
+    # ключ (created_at, id); диапазон по времени заодно отсекает месячные секции.
+    if req.query.get('userId'):
+        conditions.append('user_id = %s')
+        params.append(int_param(req.query, 'userId'))
+    if req.query.get('entityType'):
+        conditions.append('entity_type = %s')
+        params.append(req.query['entityType'])
+        if req.query.get('entityId'):
+            conditions.append('entity_id = %s')
+            params.append(int_param(req.query, 'entityId'))
+    elif req.query.get('entityId'):
+        return error(400, 'entityId requires entityType')
+    if req.query.get('from'):
+        conditions.append('created_at >= %s')
+        params.append(time_param(req.query, 'from'))
+    if req.query.get('to'):
+        conditions.append('created_at < %s')
+        params.append(time_param(req.query, 'to'))
+    if after is not None:
+        conditions.append('(created_at, id) < (%s, %s)')
+        params.extend(after)
+
+    req.cursor.execute(f"""
+        SELECT id, created_at, user_id, role, action, entity_type, entity_id, changes, request_id, ip
+        FROM audit_log
+        WHERE {' AND '.join(conditions) or 'true'}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """, (*params, limit + 1))
+    return stream_page((AuditEntry(row) for row in req.cursor), 'entries', serialize_entry, limit)
+
+
+def handler(event: dict, context) -> dict:
+    '''Журнал изменений модулей и интеграций: весь для owner, свой для admin и accountant'''
+    return router.dispatch(event, context)
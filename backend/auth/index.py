@@ -1,194 +1,146 @@
-import json
-import os
-import psycopg2
-import bcrypt
-import jwt
-from datetime import datetime, timedelta
+import secrets
+
+from passwords import check_password, hash_password, needs_rehash
+from ratelimit import check_login
+from shared import config
+from shared.http import HttpError, Request, Router, error, etag_headers, make_etag, not_modified, response
+from shared.queries import (
+    INSERT_REFRESH_TOKEN, INSERT_USER, REVOKE_REFRESH_FAMILY, REVOKE_USER_REFRESH_TOKENS, ROTATE_REFRESH_TOKEN,
+    UPDATE_PASSWORD, USER_BY_EMAIL
+)
+from shared.tokens import (
+    InvalidToken, TokenExpired, TokenRevoked, decode_token, issue_access_token, new_refresh_token, refresh_token_hash,
+    revoke
+)
+
+router = Router(auth=False)
+
+
+def session(user_id: int, email: str, role: str, refresh_token: str) -> dict:
+    token, _ = issue_access_token(user_id, email, role)
+    return {
+        'token': token,
+        'expiresIn': config.ACCESS_TOKEN_TTL,
+        'refreshToken': refresh_token,
+        'user': {'id': user_id, 'email': email, 'role': role}
+    }
+
+
+def access_payload(req: Request) -> dict:
+    if not req.token:
+        raise HttpError(401, 'No token provided')
+    try:
+        return decode_token(req.token)
+    except TokenExpired:
+        raise HttpError(401, 'Token expired')
+    except TokenRevoked:
+        raise HttpError(401, 'Token revoked')
+    except InvalidToken:
+        raise HttpError(401, 'Invalid token')
+
+
+@router.route('POST', 'login')
+def login(req: Request) -> dict:
+    email = req.body.get('email')
+    password = req.body.get('password')
+
+    retry_after = check_login(req.cursor, email, req.client_ip)
+    if retry_after:
+        return response(429, {'error': 'Too many login attempts'}, {
+            'Retry-After': str(retry_after),
+            'Access-Control-Expose-Headers': 'Retry-After'
+        })
+
+    user = USER_BY_EMAIL.one(req.cursor, (email,))
+
+    if not user:
+        return error(401, 'Invalid credentials')
+
+    if not check_password(password, user.password_hash):
+        return error(401, 'Invalid credentials')
+
+    if needs_rehash(user.password_hash):
+        UPDATE_PASSWORD.run(req.cursor, (hash_password(password), user.id))
+
+    refresh_token, token_hash = new_refresh_token()
+    INSERT_REFRESH_TOKEN.run(req.cursor, (user.id, token_hash, secrets.token_hex(16), config.REFRESH_TOKEN_TTL))
+    req.commit()
+
+    return response(200, session(user.id, email, user.role, refresh_token))
+
+
+@router.route('POST', 'refresh')
+def refresh(req: Request) -> dict:
+    '''Ротация: старый refresh-токен гасится, выдаётся новый из той же семьи'''
+    presented = req.body.get('refreshToken')
+    if not presented:
+        return error(400, 'refreshToken is required')
+
+    presented_hash = refresh_token_hash(presented)
+    refresh_token, token_hash = new_refresh_token()
+    user = ROTATE_REFRESH_TOKEN.one(req.cursor, (presented_hash, token_hash, config.REFRESH_TOKEN_TTL))
+    if not user:
+        # Погашенный токен предъявлен повторно — считаем семью украденной и гасим её целиком
+        REVOKE_REFRESH_FAMILY.run(req.cursor, (presented_hash,))
+        req.commit()
+        return error(401, 'Invalid refresh token')
+    req.commit()
+
+    return response(200, session(user.id, user.email, user.role, refresh_token))
+
+
+@router.route('POST', 'logout')
+def logout(req: Request) -> dict:
+    '''Отзывает текущий токен доступа и семью refresh-токена; с all — все сессии пользователя'''
+    payload = access_payload(req)
+    revoke(req.cursor, payload)
+    if req.body.get('all'):
+        REVOKE_USER_REFRESH_TOKENS.run(req.cursor, (payload['user_id'],))
+    elif req.body.get('refreshToken'):
+        REVOKE_REFRESH_FAMILY.run(req.cursor, (refresh_token_hash(req.body['refreshToken']),))
+    req.commit()
+
+    return response(200, {'message': 'Logged out'})
+
+
+@router.route('POST', 'register')
+def register(req: Request) -> dict:
+    email = req.body.get('email')
+    password = req.body.get('password')
+    role = req.body.get('role', 'user')
+    # owner, admin и accountant открывают чужие журналы и наборы модулей, поэтому сами себе их не выдать
+    if role not in config.REGISTER_ROLES:
+        return error(403, 'Role cannot be self-assigned')
+
+    from psycopg2 import IntegrityError
+
+    password_hash = hash_password(password)
+
+    try:
+        user_id = INSERT_USER.scalar(req.cursor, (email, password_hash, role))
+        req.commit()
+    except IntegrityError:
+        req.conn.rollback()
+        return error(400, 'User already exists')
+    except Exception:
+        req.conn.rollback()
+        return error(400, 'Registration failed')
+
+    return response(201, {
+        'message': 'User created',
+        'user': {'id': user_id, 'email': email, 'role': role}
+    })
+
+
+@router.route('GET')
+def current_user(req: Request) -> dict:
+    '''Пользователь из claims токена доступа, без запроса к users'''
+    payload = access_payload(req)
+    user = {'id': payload['user_id'], 'email': payload.get('email'), 'role': payload['role']}
+    etag = make_etag('user', user['id'], user['email'], user['role'])
+    return not_modified(req, etag) or response(200, {'user': user}, etag_headers(etag))
+
 
 def handler(event: dict, context) -> dict:
     '''API для аутентификации и управления пользователями'''
-    method = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cursor = conn.cursor()
-        
-        if method == 'POST':
-            body = json.loads(event.get('body', '{}'))
-            action = body.get('action')
-            
-            if action == 'login':
-                email = body.get('email')
-                password = body.get('password')
-                
-                cursor.execute(
-                    "SELECT id, password_hash, role FROM users WHERE email = %s",
-                    (email,)
-                )
-                user = cursor.fetchone()
-                
-                if not user:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Invalid credentials'}),
-                        'isBase64Encoded': False
-                    }
-                
-                user_id, password_hash, role = user
-                
-                if bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
-                    token = jwt.encode(
-                        {
-                            'user_id': user_id,
-                            'role': role,
-                            'exp': datetime.utcnow() + timedelta(days=7)
-                        },
-                        os.environ.get('JWT_SECRET', 'starry-sky-secret-key'),
-                        algorithm='HS256'
-                    )
-                    
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
-                            'token': token,
-                            'user': {'id': user_id, 'email': email, 'role': role}
-                        }),
-                        'isBase64Encoded': False
-                    }
-                else:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Invalid credentials'}),
-                        'isBase64Encoded': False
-                    }
-            
-            elif action == 'register':
-                email = body.get('email')
-                password = body.get('password')
-                role = body.get('role', 'user')
-                
-                password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                
-                try:
-                    cursor.execute(
-                        "INSERT INTO users (email, password_hash, role) VALUES (%s, %s, %s) RETURNING id",
-                        (email, password_hash, role)
-                    )
-                    user_id = cursor.fetchone()[0]
-                    conn.commit()
-                    
-                    return {
-                        'statusCode': 201,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
-                            'message': 'User created',
-                            'user': {'id': user_id, 'email': email, 'role': role}
-                        }),
-                        'isBase64Encoded': False
-                    }
-                except psycopg2.IntegrityError as e:
-                    conn.rollback()
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'User already exists'}),
-                        'isBase64Encoded': False
-                    }
-                except Exception as e:
-                    conn.rollback()
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Registration failed'}),
-                        'isBase64Encoded': False
-                    }
-        
-        elif method == 'GET':
-            token = event.get('headers', {}).get('X-Auth-Token')
-            
-            if not token:
-                return {
-                    'statusCode': 401,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'No token provided'}),
-                    'isBase64Encoded': False
-                }
-            
-            try:
-                payload = jwt.decode(
-                    token,
-                    os.environ.get('JWT_SECRET', 'starry-sky-secret-key'),
-                    algorithms=['HS256']
-                )
-                
-                cursor.execute(
-                    "SELECT id, email, role FROM users WHERE id = %s",
-                    (payload['user_id'],)
-                )
-                user = cursor.fetchone()
-                
-                if user:
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
-                            'user': {'id': user[0], 'email': user[1], 'role': user[2]}
-                        }),
-                        'isBase64Encoded': False
-                    }
-                else:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'User not found'}),
-                        'isBase64Encoded': False
-                    }
-            except jwt.ExpiredSignatureError:
-                return {
-                    'statusCode': 401,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Token expired'}),
-                    'isBase64Encoded': False
-                }
-            except jwt.InvalidTokenError:
-                return {
-                    'statusCode': 401,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Invalid token'}),
-                    'isBase64Encoded': False
-                }
-        
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
-    
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+    return router.dispatch(event, context)
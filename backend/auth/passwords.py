@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from shared.config import BCRYPT_ROUNDS, BCRYPT_WORKERS
+from shared.instrumentation import phase
+
+_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+
+
+# bcrypt импортируется в потоке пула при первом хэшировании, а не при холодном старте функции
+def _hash(password: bytes, rounds: int) -> bytes:
+    import bcrypt
+
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _check(password: bytes, password_hash: bytes) -> bool:
+    import bcrypt
+
+    return bcrypt.checkpw(password, password_hash)
+
+
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    '''Хэширует пароль в пуле потоков с текущей стоимостью BCRYPT_ROUNDS'''
+    with phase('crypto'):
+        future = _executor.submit(_hash, password.encode('utf-8'), rounds or BCRYPT_ROUNDS)
+        return future.result().decode('utf-8')
+
+
+def check_password(password: str, password_hash: str) -> bool:
+    '''Сверяет пароль с хэшем в пуле потоков'''
+    with phase('crypto'):
+        future = _executor.submit(_check, password.encode('utf-8'), password_hash.encode('utf-8'))
+        return future.result()
+
+
+def hash_rounds(password_hash: str) -> Optional[int]:
+    '''Стоимость из хэша вида $2b$12$...'''
+    parts = password_hash.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(password_hash: str) -> bool:
+    '''Хэш создан с другой стоимостью и должен быть пересчитан при входе'''
+    return hash_rounds(password_hash) != BCRYPT_ROUNDS
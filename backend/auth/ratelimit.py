@@ -0,0 +1,76 @@
+'''Ограничение попыток входа по email и IP: ведро токенов в памяти и общий счётчик окна в login_attempts'''
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from shared import config
+from shared.queries import COUNT_LOGIN_ATTEMPTS
+
+
+class TokenBuckets:
+    '''Вёдра на ключ: ёмкость limit, пополнение limit за window секунд; LRU на maxsize ключей'''
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: int, window: float) -> float:
+        '''Забирает токен; 0 — попытка разрешена, иначе сколько секунд ждать следующего'''
+        rate = limit / window
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (float(limit), now))
+            tokens = min(float(limit), tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+_local = TokenBuckets(config.LOGIN_RATE_BUCKETS)
+
+
+def limits(email: Optional[str], ip: Optional[str]) -> List[Tuple[str, int]]:
+    '''(ключ, лимит за окно) для включённых ограничений'''
+    keys = []
+    if email and config.LOGIN_RATE_USER > 0:
+        keys.append((f'user:{email.strip().lower()}', config.LOGIN_RATE_USER))
+    if ip and config.LOGIN_RATE_IP > 0:
+        keys.append((f'ip:{ip}', config.LOGIN_RATE_IP))
+    return keys
+
+
+def check_login(cursor, email: Optional[str], ip: Optional[str]) -> int:
+    '''0, если попытку можно проверять bcrypt, иначе Retry-After в секундах
+
+    Сначала вёдра этого контейнера (без похода в БД), затем один upsert в login_attempts,
+    чтобы лимит держался на все тёплые контейнеры; счётчик фиксируется сразу, до bcrypt.
+    '''
+    keys = limits(email, ip)
+    if not keys:
+        return 0
+
+    window = config.LOGIN_RATE_WINDOW
+    wait = max(_local.take(key, limit, window) for key, limit in keys)
+    if wait:
+        return math.ceil(wait)
+
+    allowed = dict(keys)
+    rows = COUNT_LOGIN_ATTEMPTS.execute(cursor, (window, window, list(allowed), window)).fetchall()
+    cursor.connection.commit()
+    for key, attempts, remaining in rows:
+        if attempts > allowed[key]:
+            wait = max(wait, remaining, 1.0)
+    return math.ceil(wait)
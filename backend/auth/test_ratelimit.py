@@ -0,0 +1,124 @@
+'''Ограничение попыток входа без БД и без реального времени: часы и курсор подменяются
+
+    python -m pytest backend/auth/test_ratelimit.py
+'''
+import pytest
+
+import ratelimit
+from ratelimit import TokenBuckets, check_login
+from shared import config
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeConnection:
+    prepared = None
+
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self) -> None:
+        self.commits += 1
+
+
+class FakeCursor:
+    '''Отдаёт заранее заданные строки login_attempts и запоминает параметры upsert'''
+
+    def __init__(self, rows=()):
+        self.connection = FakeConnection()
+        self.rows = list(rows)
+        self.executed = []
+
+    def execute(self, sql: str, params: tuple = ()) -> None:
+        self.executed.append(params)
+
+    def fetchall(self) -> list:
+        return self.rows
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def limiter(monkeypatch, clock) -> TokenBuckets:
+    buckets = TokenBuckets(100)
+    monkeypatch.setattr(ratelimit, '_local', buckets)
+    monkeypatch.setattr(config, 'LOGIN_RATE_WINDOW', 60.0)
+    monkeypatch.setattr(config, 'LOGIN_RATE_USER', 3)
+    monkeypatch.setattr(config, 'LOGIN_RATE_IP', 5)
+    return buckets
+
+
+def test_take_allows_limit_then_waits_for_one_token(clock):
+    buckets = TokenBuckets(10)
+    assert [buckets.take('k', 3, 60) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('k', 3, 60) == pytest.approx(20.0)
+
+
+def test_take_refills_at_limit_per_window(clock):
+    buckets = TokenBuckets(10)
+    for _ in range(3):
+        buckets.take('k', 3, 60)
+    clock.now += 20
+    assert buckets.take('k', 3, 60) == 0
+    assert buckets.take('k', 3, 60) == pytest.approx(20.0)
+
+
+def test_take_never_refills_above_limit(clock):
+    buckets = TokenBuckets(10)
+    buckets.take('k', 3, 60)
+    clock.now += 3600
+    assert [buckets.take('k', 3, 60) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('k', 3, 60) > 0
+
+
+def test_take_evicts_least_recently_used_key(clock):
+    buckets = TokenBuckets(2)
+    buckets.take('a', 1, 60)
+    buckets.take('b', 1, 60)
+    buckets.take('c', 1, 60)
+    assert buckets.take('a', 1, 60) == 0
+    assert buckets.take('c', 1, 60) > 0
+
+
+def test_check_login_without_enabled_limits_skips_db(limiter, monkeypatch):
+    monkeypatch.setattr(config, 'LOGIN_RATE_USER', 0)
+    cursor = FakeCursor()
+    assert check_login(cursor, 'a@example.com', None) == 0
+    assert cursor.executed == []
+
+
+def test_check_login_counts_both_keys_in_one_upsert(limiter):
+    cursor = FakeCursor([('user:a@example.com', 1, 59.5), ('ip:10.0.0.1', 1, 59.5)])
+    assert check_login(cursor, ' A@Example.com ', '10.0.0.1') == 0
+    assert len(cursor.executed) == 1
+    assert cursor.executed[0][2] == ['user:a@example.com', 'ip:10.0.0.1']
+    assert cursor.connection.commits == 1
+
+
+def test_check_login_rejects_when_shared_counter_is_over_limit(limiter):
+    cursor = FakeCursor([('user:a@example.com', 4, 12.2)])
+    assert check_login(cursor, 'a@example.com', None) == 13
+
+
+def test_check_login_retry_after_is_at_least_one_second(limiter):
+    cursor = FakeCursor([('user:a@example.com', 4, 0.1)])
+    assert check_login(cursor, 'a@example.com', None) == 1
+
+
+def test_check_login_local_bucket_rejects_before_db(limiter):
+    for _ in range(3):
+        assert check_login(FakeCursor([('user:a@example.com', 1, 60.0)]), 'a@example.com', None) == 0
+    cursor = FakeCursor()
+    assert check_login(cursor, 'a@example.com', None) == 20
+    assert cursor.executed == []
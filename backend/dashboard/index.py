@@ -0,0 +1,41 @@
+from shared import config
+from shared.http import Request, Router, etag_headers, make_etag, not_modified, response
+from shared.queries import DASHBOARD_SUMMARY, DashboardSummary
+
+router = Router(auth=True)
+
+
+def serialize_summary(user: dict, summary: DashboardSummary) -> dict:
+    return {
+        'user': user,
+        'modules': {
+            'total': summary.modules_total,
+            'active': summary.modules_active,
+            'premium': summary.modules_premium,
+            'activePremium': summary.modules_active_premium
+        },
+        'integrations': {
+            'total': summary.integrations_total,
+            'active': summary.integrations_active,
+            'byService': summary.services
+        }
+    }
+
+
+@router.route('GET')
+def summary(req: Request) -> dict:
+    '''Сводка для главной: пользователь, видимые модули и интеграции по сервисам — один запрос к счётчикам'''
+    user_id, role = req.user['user_id'], req.user['role']
+    user = {'id': user_id, 'email': req.user.get('email'), 'role': role}
+    row = DASHBOARD_SUMMARY.one(
+        req.cursor, (user_id, user_id, user_id, config.DASHBOARD_SERVICES_MAX, role, user_id)
+    )
+    # byService ограничен DASHBOARD_SERVICES_MAX; полный список — GET integrations
+    data = serialize_summary(user, row)
+    etag = make_etag('dashboard', data)
+    return not_modified(req, etag) or response(200, data, etag_headers(etag))
+
+
+def handler(event: dict, context) -> dict:
+    '''Сводка по модулям и интеграциям пользователя для главной страницы'''
+    return router.dispatch(event, context)
@@ -1,193 +1,315 @@
 import json
-import os
-import psycopg2
-import jwt
-from typing import Optional
-
-def verify_token(token: str) -> Optional[dict]:
-    '''Проверка JWT токена'''
-    try:
-        payload = jwt.decode(
-            token,
-            os.environ.get('JWT_SECRET', 'starry-sky-secret-key'),
-            algorithms=['HS256']
+
+from shared import audit, config
+from shared.http import HttpError, Request, Router, error, etag_headers, make_etag, not_modified, response
+from shared.outbox import enqueue_for_integrations, webhook_url_error
+from shared.pagination import page_params, stream_page
+from shared.queries import (
+    INSERT_INTEGRATION, INTEGRATION_BY_SERVICE, INTEGRATIONS_FIRST_PAGE, INTEGRATIONS_PAGE_AFTER, INTEGRATIONS_STATE,
+    UPDATE_INTEGRATION, Integration
+)
+from shared.vault import encrypt_optional
+
+router = Router(auth=True)
+
+INTEGRATION_FIELDS = ('service', 'apiKey', 'webhookUrl', 'settings', 'isActive')
+
+FILTER_PARAMS = ('isActive', 'servicePrefix', 'settings')
+
+
+def serialize_integration(integration: Integration) -> dict:
+    return {
+        'id': integration.id,
+        'service': integration.service_name,
+        'webhookUrl': integration.webhook_url,
+        'settings': integration.settings,
+        'isActive': integration.is_active
+    }
+
+
+@router.route('GET')
+def get_integrations(req: Request) -> dict:
+    service = req.query.get('service')
+    if service:
+        return get_integration(req, service)
+
+    limit, after = page_params(req.query)
+    filters = filter_conditions(req.query)
+
+    state = INTEGRATIONS_STATE.execute(req.cursor, (req.user['user_id'],)).fetchone()
+    etag = make_etag('integrations', req.user['user_id'], *state, limit, after,
+                     *(req.query.get(name) for name in FILTER_PARAMS))
+    unchanged = not_modified(req, etag)
+    if unchanged:
+        return unchanged
+
+    if filters:
+        rows = filtered_page(req, *filters, limit, after)
+    elif after is None:
+        rows = INTEGRATIONS_FIRST_PAGE.iter(req.cursor, (req.user['user_id'], limit + 1))
+    else:
+        rows = INTEGRATIONS_PAGE_AFTER.iter(req.cursor, (req.user['user_id'], *after, limit + 1))
+    return stream_page(rows, 'integrations', serialize_integration, limit, etag_headers(etag))
+
+
+def filter_conditions(query: dict):
+    '''Условия и параметры для isActive, servicePrefix и settings (JSON-объект для @>); None без фильтров'''
+    conditions, params = [], []
+    if query.get('isActive'):
+        if query['isActive'] not in ('true', 'false'):
+            raise HttpError(400, 'isActive must be true or false')
+        conditions.append('is_active = %s')
+        params.append(query['isActive'] == 'true')
+    if query.get('servicePrefix'):
+        prefix = query['servicePrefix'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        conditions.append('service_name LIKE %s')
+        params.append(prefix + '%')
+    if query.get('settings'):
+        try:
+            settings = json.loads(query['settings'])
+        except ValueError:
+            settings = None
+        if not isinstance(settings, dict):
+            raise HttpError(400, 'settings must be a JSON object')
+        conditions.append('settings @> %s::jsonb')
+        params.append(json.dumps(settings))
+    return (conditions, params) if conditions else None
+
+
+def filtered_page(req: Request, conditions: list, params: list, limit: int, after):
+    '''Страница с фильтрами одним запросом без PREPARE: план строится под конкретные значения
+
+    Узкий settings @> ... идёт по GIN idx_integrations_settings, префикс — диапазоном по
+    idx_integrations_user_service_prefix (varchar_pattern_ops, при любой сортировке базы),
+    остальное — по (user_id, created_at, id).
+    '''
+    if after is not None:
+        conditions = [*conditions, '(created_at, id) < (%s, %s)']
+        params = [*params, *after]
+    req.cursor.execute(f"""
+        SELECT id, service_name, webhook_url, settings, is_active, created_at
+        FROM integrations
+        WHERE user_id = %s AND {' AND '.join(conditions)}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """, (req.user['user_id'], *params, limit + 1))
+    return (Integration(row) for row in req.cursor)
+
+
+def get_integration(req: Request, service: str) -> dict:
+    integration = INTEGRATION_BY_SERVICE.one(req.cursor, (req.user['user_id'], service))
+    if not integration:
+        return error(404, 'Integration not found')
+
+    etag = make_etag('integration', integration.id, integration.updated_at)
+    unchanged = not_modified(req, etag)
+    if unchanged:
+        return unchanged
+
+    return response(200, {'integration': {
+        'id': integration.id,
+        'service': integration.service_name,
+        'hasApiKey': integration.has_api_key,
+        'webhookUrl': integration.webhook_url,
+        'settings': integration.settings,
+        'isActive': integration.is_active
+    }}, etag_headers(etag))
+
+
+@router.route('POST')
+def create_integration(req: Request) -> dict:
+    body = req.body
+    invalid = webhook_url_error(body['webhookUrl']) if body.get('webhookUrl') is not None else None
+    if invalid:
+        return error(400, invalid)
+    encrypted, fingerprint = encrypt_optional(body.get('apiKey'), req.user['user_id'])
+    integration_id = INSERT_INTEGRATION.scalar(req.cursor, (
+        req.user['user_id'],
+        body['service'],
+        encrypted,
+        fingerprint,
+        body.get('webhookUrl'),
+        json.dumps(body.get('settings', {})),
+        body.get('isActive', True)
+    ))
+    enqueue_for_integrations(req.cursor, req.user['user_id'], 'integration.created', [integration_id])
+    audit.record(
+        req, 'integration.created', 'integration', integration_id, audit.changes_from(body, INTEGRATION_FIELDS)
+    )
+    req.commit()
+
+    return response(201, {'message': 'Integration created', 'id': integration_id})
+
+
+@router.route('PUT')
+def update_integration(req: Request) -> dict:
+    body = req.body
+    invalid = webhook_url_error(body['webhookUrl']) if body.get('webhookUrl') is not None else None
+    if invalid:
+        return error(400, invalid)
+    encrypted, fingerprint = encrypt_optional(body.get('apiKey'), req.user['user_id'])
+    updated = UPDATE_INTEGRATION.run(req.cursor, (
+        encrypted,
+        fingerprint,
+        encrypted,
+        body.get('webhookUrl'),
+        json.dumps(body.get('settings')) if body.get('settings') else None,
+        body.get('isActive'),
+        body.get('id'),
+        req.user['user_id']
+    ))
+
+    if updated:
+        enqueue_for_integrations(req.cursor, req.user['user_id'], 'integration.updated', [body.get('id')])
+        audit.record(
+            req, 'integration.updated', 'integration', body.get('id'), audit.changes_from(body, INTEGRATION_FIELDS)
+        )
+    req.commit()
+
+    return response(200, {'message': 'Integration updated'})
+
+
+def bulk_item_error(item: dict):
+    '''Ошибка типов в элементе пакета или None; такой элемент получает error в results, остальные пишутся'''
+    if item.get('isActive') is not None and not isinstance(item['isActive'], bool):
+        return 'isActive must be boolean'
+    if item.get('settings') is not None and not isinstance(item['settings'], dict):
+        return 'settings must be an object'
+    if item.get('apiKey') is not None and not isinstance(item['apiKey'], str):
+        return 'apiKey must be a string'
+    if item.get('webhookUrl') is not None:
+        return webhook_url_error(item['webhookUrl'])
+    return None
+
+
+@router.route('POST', 'bulk')
+def bulk_upsert(req: Request) -> dict:
+    '''Создание и обновление пачки интеграций одной транзакцией'''
+    items = req.body.get('items')
+    if not isinstance(items, list) or not items:
+        return error(400, 'items must be a non-empty list')
+    if len(items) > config.BULK_MAX_ITEMS:
+        return error(400, f'Too many items, max {config.BULK_MAX_ITEMS}')
+
+    results = [None] * len(items)
+    positions = {}
+    for index, item in enumerate(items):
+        service = item.get('service') if isinstance(item, dict) else None
+        if not service:
+            results[index] = {'index': index, 'error': 'service is required'}
+            continue
+        if not isinstance(service, str):
+            results[index] = {'index': index, 'error': 'service must be a string'}
+            continue
+        invalid = bulk_item_error(item)
+        if invalid:
+            results[index] = {'index': index, 'service': service, 'error': invalid}
+        elif service in positions:
+            results[index] = {'index': index, 'service': service, 'error': 'Duplicate service in batch'}
+        else:
+            positions[service] = index
+
+    values = [
+        (
+            req.user['user_id'],
+            service,
+            *encrypt_optional(items[index].get('apiKey'), req.user['user_id']),
+            items[index].get('webhookUrl'),
+            json.dumps(items[index].get('settings') or {}),
+            items[index].get('isActive')
         )
-        return payload
-    except:
-        return None
+        for service, index in positions.items()
+    ]
+
+    if values:
+        from psycopg2.extras import execute_values
+
+        # Без isActive существующая интеграция сохраняет своё состояние, как в PUT; EXCLUDED не отличает
+        # пропущенное поле от true, поэтому новые строки без isActive включаются отдельным UPDATE ниже
+        rows = execute_values(req.cursor, """
+            INSERT INTO integrations
+            (user_id, service_name, api_key_encrypted, api_key_fingerprint, webhook_url, settings, is_active)
+            VALUES %s
+            ON CONFLICT (user_id, service_name) DO UPDATE
+            SET api_key_encrypted = COALESCE(EXCLUDED.api_key_encrypted, integrations.api_key_encrypted),
+                api_key_fingerprint = COALESCE(EXCLUDED.api_key_fingerprint, integrations.api_key_fingerprint),
+                api_key = CASE WHEN EXCLUDED.api_key_encrypted IS NULL THEN integrations.api_key END,
+                webhook_url = COALESCE(EXCLUDED.webhook_url, integrations.webhook_url),
+                settings = integrations.settings || EXCLUDED.settings,
+                is_active = COALESCE(EXCLUDED.is_active, integrations.is_active),
+                updated_at = CURRENT_TIMESTAMP
+            RETURNING id, service_name, xmax = 0, is_active IS NULL
+        """, values, template='(%s, %s, %s::bytea, %s, %s, %s::jsonb, %s::boolean)', page_size=len(values),
+            fetch=True)
+        activate = [row[0] for row in rows if row[3]]
+        if activate:
+            req.cursor.execute("UPDATE integrations SET is_active = true WHERE id = ANY(%s)", (activate,))
+        rows = [row[:3] for row in rows]
+
+        created = [row[0] for row in rows if row[2]]
+        updated = [row[0] for row in rows if not row[2]]
+        enqueue_for_integrations(req.cursor, req.user['user_id'], 'integration.created', created)
+        enqueue_for_integrations(req.cursor, req.user['user_id'], 'integration.updated', updated)
+        for integration_id, service, inserted in rows:
+            audit.record(
+                req, 'integration.created' if inserted else 'integration.updated', 'integration', integration_id,
+                audit.changes_from(items[positions[service]], INTEGRATION_FIELDS)
+            )
+        req.commit()
+
+        for integration_id, service, inserted in rows:
+            index = positions[service]
+            results[index] = {
+                'index': index,
+                'service': service,
+                'id': integration_id,
+                'status': 'created' if inserted else 'updated'
+            }
+
+    return response(200, {'results': results})
+
+
+@router.route('PUT', 'toggle')
+def bulk_toggle(req: Request) -> dict:
+    '''Массовое включение и выключение; без ids и services — все интеграции пользователя'''
+    is_active = req.body.get('isActive')
+    if not isinstance(is_active, bool):
+        return error(400, 'isActive must be boolean')
+
+    ids, services = req.body.get('ids'), req.body.get('services')
+    if ids is not None and not (
+        isinstance(ids, list) and all(isinstance(i, int) and not isinstance(i, bool) for i in ids)
+    ):
+        return error(400, 'ids must be a list of integers')
+    if services is not None and not (isinstance(services, list) and all(isinstance(s, str) for s in services)):
+        return error(400, 'services must be a list of strings')
+
+    # Пустой список ничего не выбирает; все интеграции — только без ids и services
+    conditions = ['user_id = %s']
+    params = [is_active, req.user['user_id']]
+    if ids is not None:
+        conditions.append('id = ANY(%s)')
+        params.append(ids)
+    if services is not None:
+        conditions.append('service_name = ANY(%s)')
+        params.append(services)
+
+    req.cursor.execute(f"""
+        UPDATE integrations
+        SET is_active = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE {' AND '.join(conditions)} AND is_active IS DISTINCT FROM %s
+        RETURNING id
+    """, (*params, is_active))
+    updated = [row[0] for row in req.cursor.fetchall()]
+    event_type = 'integration.activated' if is_active else 'integration.deactivated'
+    enqueue_for_integrations(req.cursor, req.user['user_id'], event_type, updated)
+    for integration_id in updated:
+        audit.record(req, event_type, 'integration', integration_id, {'isActive': is_active})
+    req.commit()
+
+    return response(200, {'message': 'Integrations updated', 'ids': updated})
+
 
 def handler(event: dict, context) -> dict:
     '''API для управления интеграциями с внешними сервисами'''
-    method = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    token = event.get('headers', {}).get('X-Auth-Token')
-    if not token:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'No token provided'}),
-            'isBase64Encoded': False
-        }
-    
-    user_data = verify_token(token)
-    if not user_data:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid token'}),
-            'isBase64Encoded': False
-        }
-    
-    try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cursor = conn.cursor()
-        
-        if method == 'GET':
-            service = event.get('queryStringParameters', {}).get('service')
-            
-            if service:
-                cursor.execute("""
-                    SELECT id, service_name, api_key, webhook_url, settings, is_active
-                    FROM integrations
-                    WHERE user_id = %s AND service_name = %s
-                """, (user_data['user_id'], service))
-                
-                row = cursor.fetchone()
-                if row:
-                    integration = {
-                        'id': row[0],
-                        'service': row[1],
-                        'hasApiKey': bool(row[2]),
-                        'webhookUrl': row[3],
-                        'settings': row[4],
-                        'isActive': row[5]
-                    }
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'integration': integration}),
-                        'isBase64Encoded': False
-                    }
-                else:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Integration not found'}),
-                        'isBase64Encoded': False
-                    }
-            else:
-                cursor.execute("""
-                    SELECT id, service_name, webhook_url, settings, is_active
-                    FROM integrations
-                    WHERE user_id = %s
-                    ORDER BY created_at DESC
-                """, (user_data['user_id'],))
-                
-                integrations = []
-                for row in cursor.fetchall():
-                    integrations.append({
-                        'id': row[0],
-                        'service': row[1],
-                        'webhookUrl': row[2],
-                        'settings': row[3],
-                        'isActive': row[4]
-                    })
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'integrations': integrations}),
-                    'isBase64Encoded': False
-                }
-        
-        elif method == 'POST':
-            body = json.loads(event.get('body', '{}'))
-            
-            cursor.execute("""
-                INSERT INTO integrations 
-                (user_id, service_name, api_key, webhook_url, settings, is_active)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """, (
-                user_data['user_id'],
-                body['service'],
-                body.get('apiKey'),
-                body.get('webhookUrl'),
-                json.dumps(body.get('settings', {})),
-                body.get('isActive', True)
-            ))
-            
-            integration_id = cursor.fetchone()[0]
-            conn.commit()
-            
-            return {
-                'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'message': 'Integration created',
-                    'id': integration_id
-                }),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'PUT':
-            body = json.loads(event.get('body', '{}'))
-            integration_id = body.get('id')
-            
-            cursor.execute("""
-                UPDATE integrations
-                SET api_key = COALESCE(%s, api_key),
-                    webhook_url = COALESCE(%s, webhook_url),
-                    settings = COALESCE(%s, settings),
-                    is_active = COALESCE(%s, is_active),
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s AND user_id = %s
-            """, (
-                body.get('apiKey'),
-                body.get('webhookUrl'),
-                json.dumps(body.get('settings')) if body.get('settings') else None,
-                body.get('isActive'),
-                integration_id,
-                user_data['user_id']
-            ))
-            
-            conn.commit()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': 'Integration updated'}),
-                'isBase64Encoded': False
-            }
-        
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
-    
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
+    return router.dispatch(event, context)
@@ -0,0 +1,129 @@
+'''Запись интеграции и журнал без БД: курсор, пул и проверка токена подменяются
+
+    python -m pytest backend/integrations/test_integrations.py
+'''
+import importlib.util
+import json
+import os
+import re
+
+import pytest
+
+from shared import audit, http
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MIGRATION = os.path.join(HERE, '..', '..', 'db_migrations', 'V0009__create_audit_log.sql')
+
+# index.py есть у каждой функции, поэтому модуль грузится по пути, а не из sys.path
+_spec = importlib.util.spec_from_file_location('integrations_index', os.path.join(HERE, 'index.py'))
+index = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(index)
+
+
+def check_arrays() -> tuple:
+    '''Ключи, которые CHECK audit_log_no_secrets запрещает на верхнем уровне changes и в changes.settings'''
+    with open(MIGRATION, encoding='utf-8') as f:
+        sql = f.read()
+    top, settings = re.findall(r"\?\| ARRAY\[([^\]]*)\]", sql)
+    return tuple(re.findall(r"'(\w+)'", top)), tuple(re.findall(r"'(\w+)'", settings))
+
+
+def passes_check(changes: dict) -> bool:
+    top, settings = check_arrays()
+    return not set(changes) & set(top) and not set(changes.get('settings') or {}) & set(settings)
+
+
+class FakeCursor:
+    def __init__(self):
+        self.connection = None
+        self.executed = []
+        self.rowcount = 1
+
+    def execute(self, sql: str, params: tuple = ()) -> None:
+        self.executed.append((sql, params))
+
+    def fetchone(self) -> tuple:
+        return (7,)
+
+    def close(self) -> None:
+        pass
+
+
+class FakeConnection:
+    prepared = None
+
+    def __init__(self):
+        self.committed = False
+
+    def cursor(self) -> FakeCursor:
+        cursor = FakeCursor()
+        cursor.connection = self
+        return cursor
+
+    def commit(self) -> None:
+        self.committed = True
+
+
+class FakePool:
+    def __init__(self):
+        self.conn = FakeConnection()
+
+    def acquire(self) -> FakeConnection:
+        return self.conn
+
+    def release(self, conn) -> None:
+        pass
+
+
+@pytest.fixture
+def flushed(monkeypatch) -> list:
+    '''Записи журнала, которые ушли бы в audit_log одним INSERT'''
+    entries = []
+    monkeypatch.setattr(http, 'verify_token', lambda token: {'user_id': 1, 'email': 'a@example.com', 'role': 'user'})
+    monkeypatch.setattr(http, '_pool', FakePool)
+    monkeypatch.setattr(audit, 'flush', lambda cursor, batch: entries.extend(batch))
+    return entries
+
+
+def post(body: dict) -> dict:
+    return index.handler({
+        'httpMethod': 'POST',
+        'headers': {'X-Auth-Token': 'token'},
+        'body': json.dumps(body)
+    }, None)
+
+
+def test_check_constraint_matches_secret_lists():
+    top, settings = check_arrays()
+    assert set(top) == set(audit.SECRET_FIELDS + audit.SECRET_SETTINGS)
+    assert set(settings) == set(audit.SECRET_SETTINGS)
+
+
+def test_post_with_api_key_in_settings_is_logged_without_it(flushed):
+    result = post({'service': 'telegram', 'settings': {'apiKey': 'sk-live', 'region': 'ru'}})
+
+    assert result['statusCode'] == 201
+    assert len(flushed) == 1
+    changes = json.loads(flushed[0][5])
+    assert changes['settings'] == {'region': 'ru'}
+    assert changes['apiKeyChanged'] is True
+    assert 'sk-live' not in flushed[0][5]
+    assert passes_check(changes)
+
+
+def test_post_logs_only_the_fact_of_secret_changes(flushed):
+    result = post({
+        'service': 'slack',
+        'webhookUrl': 'https://hooks.slack.com/services/T000/B000/XXXX',
+        'settings': {'webhookSecret': 'whsec', 'channel': '#ops'}
+    })
+
+    assert result['statusCode'] == 201
+    changes = json.loads(flushed[0][5])
+    assert changes == {
+        'service': 'slack',
+        'webhookUrlChanged': True,
+        'webhookSecretChanged': True,
+        'settings': {'channel': '#ops'}
+    }
+    assert passes_check(changes)
@@ -0,0 +1,84 @@
+'''Формат конверта api_key: шифрование и расшифровка с подменённым мастер-ключом, без БД
+
+    python -m pytest backend/integrations/test_vault.py
+'''
+import base64
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from shared import config, vault
+
+MASTER = base64.b64encode(bytes(range(32))).decode('ascii')
+OTHER_MASTER = base64.b64encode(bytes(range(1, 33))).decode('ascii')
+
+
+def use_master(monkeypatch, value: str) -> None:
+    monkeypatch.setattr(config, 'SECRETS_MASTER_KEY', value)
+    monkeypatch.setattr(vault, '_master', None)
+
+
+@pytest.fixture(autouse=True)
+def master(monkeypatch) -> None:
+    use_master(monkeypatch, MASTER)
+
+
+def test_round_trip():
+    blob, fingerprint = vault.encrypt('sk-live-123', 7)
+    assert vault.decrypt(blob, 7) == 'sk-live-123'
+    assert fingerprint == vault.fingerprint('sk-live-123')
+
+
+def test_envelope_layout():
+    secret = 'sk-live-123'
+    blob, _ = vault.encrypt(secret, 7)
+    assert blob[0] == vault.FORMAT_VERSION
+    # версия | nonce | обёрнутый ключ | nonce | шифротекст + тег GCM
+    assert len(blob) == 1 + vault.NONCE_SIZE + vault.WRAPPED_KEY_SIZE + vault.NONCE_SIZE + len(secret) + 16
+    assert secret.encode('utf-8') not in blob
+
+
+def test_fresh_data_key_and_nonces_per_record():
+    first, first_fingerprint = vault.encrypt('same', 7)
+    second, second_fingerprint = vault.encrypt('same', 7)
+    assert first != second
+    assert first_fingerprint == second_fingerprint
+
+
+def test_other_user_cannot_decrypt():
+    blob, _ = vault.encrypt('sk-live-123', 7)
+    with pytest.raises(InvalidTag):
+        vault.decrypt(blob, 8)
+
+
+def test_other_master_key_cannot_decrypt(monkeypatch):
+    blob, fingerprint = vault.encrypt('sk-live-123', 7)
+    use_master(monkeypatch, OTHER_MASTER)
+    with pytest.raises(InvalidTag):
+        vault.decrypt(blob, 7)
+    assert vault.fingerprint('sk-live-123') != fingerprint
+
+
+def test_tampered_ciphertext_is_rejected():
+    blob, _ = vault.encrypt('sk-live-123', 7)
+    tampered = blob[:-1] + bytes([blob[-1] ^ 1])
+    with pytest.raises(InvalidTag):
+        vault.decrypt(tampered, 7)
+
+
+def test_unknown_format_version_is_rejected():
+    blob, _ = vault.encrypt('sk-live-123', 7)
+    with pytest.raises(vault.VaultError):
+        vault.decrypt(bytes([vault.FORMAT_VERSION + 1]) + blob[1:], 7)
+
+
+@pytest.mark.parametrize('value', ['', base64.b64encode(b'short').decode('ascii')])
+def test_missing_or_short_master_key_is_rejected(monkeypatch, value):
+    use_master(monkeypatch, value)
+    with pytest.raises(vault.VaultError):
+        vault.encrypt('sk-live-123', 7)
+
+
+def test_empty_secret_is_not_encrypted():
+    assert vault.encrypt_optional(None, 7) == (None, None)
+    assert vault.encrypt_optional('', 7) == (None, None)
@@ -0,0 +1,44 @@
+import time
+
+from shared import audit, config
+from shared.http import error, response, scheduled
+from shared.queries import PRUNE_LOGIN_ATTEMPTS, PRUNE_REFRESH_TOKENS, PRUNE_REVOKED_TOKENS, Query
+
+
+def prune(query: Query, params: tuple, batch: int, deadline: float) -> int:
+    '''Удаляет строки пачками по индексу срока: каждая пачка — своя транзакция
+
+    Проход останавливается на неполной пачке или к deadline, остаток дочищает следующий тик.
+    '''
+    from shared.db import get_pool
+
+    deleted = 0
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        with conn.cursor() as cursor:
+            while time.monotonic() < deadline:
+                count = query.run(cursor, params)
+                conn.commit()
+                deleted += count
+                if count < batch:
+                    break
+    finally:
+        pool.release(conn)
+    return deleted
+
+
+def handler(event: dict, context) -> dict:
+    '''Плановое обслуживание БД: секции audit_log и чистка истёкших строк; вызывается по таймеру'''
+    if not scheduled(event):
+        return error(403, 'Access denied')
+
+    stats = {'auditPartitions': audit.ensure_partitions()}
+    # MAINTENANCE_SECONDS — общий бюджет на все чистки
+    deadline = time.monotonic() + config.MAINTENANCE_SECONDS
+    window, batch = config.LOGIN_RATE_WINDOW, config.LOGIN_ATTEMPTS_PRUNE_BATCH
+    stats['loginAttemptsPruned'] = prune(PRUNE_LOGIN_ATTEMPTS, (window, batch, window), batch, deadline)
+    batch = config.TOKENS_PRUNE_BATCH
+    stats['refreshTokensPruned'] = prune(PRUNE_REFRESH_TOKENS, (batch,), batch, deadline)
+    stats['revokedTokensPruned'] = prune(PRUNE_REVOKED_TOKENS, (batch,), batch, deadline)
+    return response(200, stats)
@@ -1,171 +1,170 @@
-import json
-import os
-import psycopg2
-import jwt
+from shared import audit, config
+from shared.cache import TTLCache
+from shared.http import HttpError, Request, Router, error, etag_headers, make_etag, not_modified, response
+from shared.outbox import enqueue
+from shared.pagination import page_params, stream_page
+from shared.queries import (
+    ENTITLEMENTS, INSERT_MODULE, MODULES_FIRST_PAGE, MODULES_PAGE_AFTER, UPDATE_MODULE, Entitlement, Module
+)
+from shared.versions import bump_version, current_version
 
-def verify_token(token: str) -> dict:
-    '''Проверка JWT токена'''
+router = Router(auth=True)
+
+MODULES_VERSION = 'modules'
+MODULE_FIELDS = ('name', 'icon', 'isPremium', 'isActive', 'allowedRoles')
+
+_visible = TTLCache(maxsize=config.MODULES_CACHE_SIZE, ttl=config.MODULES_CACHE_TTL)
+
+
+def serialize_module(module: Module) -> dict:
+    return {
+        'id': str(module.id),
+        'name': module.name,
+        'icon': module.icon,
+        'isPremium': module.is_premium,
+        'isActive': module.is_active,
+        'allowedRoles': module.allowed_roles,
+        'ownerId': module.owner_id
+    }
+
+
+@router.route('GET')
+def list_modules(req: Request) -> dict:
+    '''Видимые модули; страница кэшируется на (роль, владелец) до смены версии modules'''
+    limit, after = page_params(req.query)
+    version = current_version(req.cursor, MODULES_VERSION)
+
+    key = (req.user['role'], req.user['user_id'], limit, after)
+    etag = make_etag(MODULES_VERSION, version, *key)
+    unchanged = not_modified(req, etag)
+    if unchanged:
+        return unchanged
+
+    cached = _visible.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    page = query_modules(req, limit, after, etag)
+    _visible.set(key, (version, page))
+    return page
+
+
+def query_modules(req: Request, limit: int, after, etag: str) -> dict:
+    if after is None:
+        rows = MODULES_FIRST_PAGE.iter(req.cursor, (req.user['user_id'], req.user['role'], limit + 1))
+    else:
+        rows = MODULES_PAGE_AFTER.iter(req.cursor, (req.user['user_id'], req.user['role'], *after, limit + 1))
+    return stream_page(rows, 'modules', serialize_module, limit, etag_headers(etag))
+
+
+ADMIN_ROLES = ('owner', 'admin')
+
+
+def serialize_entitlement(entitlement: Entitlement) -> dict:
+    return {
+        'id': str(entitlement.id),
+        'name': entitlement.name,
+        'icon': entitlement.icon,
+        'isPremium': entitlement.is_premium,
+        'isOwner': entitlement.is_owner,
+        'enabled': entitlement.enabled,
+        'settings': entitlement.settings
+    }
+
+
+def parse_user_id(value) -> int:
+    if isinstance(value, bool):
+        raise HttpError(400, 'Invalid user id')
     try:
-        payload = jwt.decode(
-            token,
-            os.environ.get('JWT_SECRET', 'starry-sky-secret-key'),
-            algorithms=['HS256']
-        )
-        return payload
-    except:
-        return None
+        return int(value)
+    except (TypeError, ValueError):
+        raise HttpError(400, 'Invalid user id')
+
+
+def resolve_entitlements(req: Request, user_ids: list) -> dict:
+    '''Модули каждого пользователя одним запросом: видимость по роли, владение, user_modules'''
+    resolved = {user_id: [] for user_id in user_ids}
+    for entitlement in ENTITLEMENTS.iter(req.cursor, (user_ids,)):
+        resolved[entitlement.user_id].append(serialize_entitlement(entitlement))
+    return resolved
+
+
+@router.route('GET', 'entitlements')
+def user_entitlements(req: Request) -> dict:
+    '''Итоговый набор модулей пользователя; чужой могут смотреть owner и admin'''
+    user_id = parse_user_id(req.query.get('userId', req.user['user_id']))
+    if user_id != req.user['user_id'] and req.user['role'] not in ADMIN_ROLES:
+        return error(403, 'Access denied')
+
+    return response(200, {'userId': user_id, 'modules': resolve_entitlements(req, [user_id])[user_id]})
+
+
+@router.route('POST', 'entitlements')
+def batch_entitlements(req: Request) -> dict:
+    '''Наборы модулей для списка userIds (админские экраны) одним запросом'''
+    if req.user['role'] not in ADMIN_ROLES:
+        return error(403, 'Access denied')
+
+    raw_ids = req.body.get('userIds')
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return error(400, 'userIds must be a non-empty list')
+    if len(raw_ids) > config.BULK_MAX_ITEMS:
+        return error(400, f'Too many userIds, max {config.BULK_MAX_ITEMS}')
+
+    user_ids = list(dict.fromkeys(parse_user_id(value) for value in raw_ids))
+    resolved = resolve_entitlements(req, user_ids)
+    return response(200, {
+        'entitlements': [{'userId': user_id, 'modules': modules} for user_id, modules in resolved.items()]
+    })
+
+
+@router.route('POST')
+def create_module(req: Request) -> dict:
+    if req.user['role'] != 'owner':
+        return error(403, 'Only owner can create modules')
+
+    body = req.body
+    module_id = INSERT_MODULE.scalar(req.cursor, (
+        body['name'],
+        body['icon'],
+        body.get('isPremium', False),
+        body.get('isActive', True),
+        body['allowedRoles'],
+        req.user['user_id']
+    ))
+    bump_version(req.cursor, MODULES_VERSION)
+    enqueue(req.cursor, req.user['user_id'], 'module.created', {'id': str(module_id), 'name': body['name']})
+    audit.record(req, 'module.created', 'module', module_id, audit.changes_from(body, MODULE_FIELDS))
+    req.commit()
+
+    return response(201, {'message': 'Module created', 'id': str(module_id)})
+
+
+@router.route('PUT')
+def update_module(req: Request) -> dict:
+    if req.user['role'] != 'owner':
+        return error(403, 'Only owner can update modules')
+
+    body = req.body
+    updated = UPDATE_MODULE.run(req.cursor, (
+        body['name'],
+        body['icon'],
+        body.get('isPremium', False),
+        body.get('isActive', True),
+        body['allowedRoles'],
+        body.get('id'),
+        req.user['user_id']
+    ))
+
+    if updated:
+        bump_version(req.cursor, MODULES_VERSION)
+        enqueue(req.cursor, req.user['user_id'], 'module.updated', {'id': str(body.get('id')), 'name': body['name']})
+        audit.record(req, 'module.updated', 'module', body.get('id'), audit.changes_from(body, MODULE_FIELDS))
+    req.commit()
+
+    return response(200, {'message': 'Module updated'})
+
 
 def handler(event: dict, context) -> dict:
     '''API для управления модулями платформы'''
-    method = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    token = event.get('headers', {}).get('X-Auth-Token')
-    if not token:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'No token provided'}),
-            'isBase64Encoded': False
-        }
-    
-    user_data = verify_token(token)
-    if not user_data:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid token'}),
-            'isBase64Encoded': False
-        }
-    
-    try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
-        cursor = conn.cursor()
-        
-        if method == 'GET':
-            cursor.execute("""
-                SELECT id, name, icon, is_premium, is_active, allowed_roles, owner_id
-                FROM modules
-                WHERE owner_id = %s OR %s = ANY(allowed_roles)
-                ORDER BY created_at DESC
-            """, (user_data['user_id'], user_data['role']))
-            
-            modules = []
-            for row in cursor.fetchall():
-                modules.append({
-                    'id': str(row[0]),
-                    'name': row[1],
-                    'icon': row[2],
-                    'isPremium': row[3],
-                    'isActive': row[4],
-                    'allowedRoles': row[5],
-                    'ownerId': row[6]
-                })
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'modules': modules}),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'POST':
-            if user_data['role'] != 'owner':
-                return {
-                    'statusCode': 403,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Only owner can create modules'}),
-                    'isBase64Encoded': False
-                }
-            
-            body = json.loads(event.get('body', '{}'))
-            
-            cursor.execute("""
-                INSERT INTO modules (name, icon, is_premium, is_active, allowed_roles, owner_id)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """, (
-                body['name'],
-                body['icon'],
-                body.get('isPremium', False),
-                body.get('isActive', True),
-                body['allowedRoles'],
-                user_data['user_id']
-            ))
-            
-            module_id = cursor.fetchone()[0]
-            conn.commit()
-            
-            return {
-                'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': 'Module created', 'id': str(module_id)}),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'PUT':
-            if user_data['role'] != 'owner':
-                return {
-                    'statusCode': 403,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Only owner can update modules'}),
-                    'isBase64Encoded': False
-                }
-            
-            body = json.loads(event.get('body', '{}'))
-            module_id = body.get('id')
-            
-            cursor.execute("""
-                UPDATE modules
-                SET name = %s, icon = %s, is_premium = %s, is_active = %s, 
-                    allowed_roles = %s, updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s AND owner_id = %s
-            """, (
-                body['name'],
-                body['icon'],
-                body.get('isPremium', False),
-                body.get('isActive', True),
-                body['allowedRoles'],
-                module_id,
-                user_data['user_id']
-            ))
-            
-            conn.commit()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': 'Module updated'}),
-                'isBase64Encoded': False
-            }
-        
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
-    
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
+    return router.dispatch(event, context)
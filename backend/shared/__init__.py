@@ -0,0 +1 @@
+'''Общий код для backend-функций: подключается в каждую функцию симлинком shared/'''
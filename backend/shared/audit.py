@@ -0,0 +1,82 @@
+'''Журнал изменений: записи копятся в запросе и уходят одним INSERT перед фиксацией его транзакции'''
+import json
+from typing import Iterable, Optional
+
+from shared import config, instrumentation
+
+# Эти поля тела запроса и ключи settings в журнал не пишутся, только факт их изменения
+# (в адресах хуков Telegram и Slack лежит токен). CHECK audit_log_no_secrets в V0009__create_audit_log.sql
+# строится из этих же списков: ключи верхнего уровня — SECRET_FIELDS + SECRET_SETTINGS, в settings —
+# SECRET_SETTINGS; расхождение ловит backend/integrations/test_integrations.py
+SECRET_FIELDS = ('apiKey', 'webhookUrl')
+SECRET_SETTINGS = ('apiKey', 'webhookSecret')
+
+
+def changes_from(body: dict, fields: Iterable[str]) -> dict:
+    '''Переданные клиентом поля; секреты заменяются на <поле>Changed: true'''
+    changes = {}
+    for field in fields:
+        if field not in body or body[field] is None:
+            continue
+        if field in SECRET_FIELDS:
+            changes[f'{field}Changed'] = True
+        elif field == 'settings' and isinstance(body[field], dict):
+            settings = dict(body[field])
+            for key in SECRET_SETTINGS:
+                if settings.pop(key, None) is not None:
+                    changes[f'{key}Changed'] = True
+            changes[field] = settings
+        else:
+            changes[field] = body[field]
+    return changes
+
+
+def _ip(value: Optional[str]) -> Optional[str]:
+    '''В inet пишется только то, что разбирается как адрес (X-Forwarded-For формирует не шлюз)'''
+    import ipaddress
+
+    try:
+        return str(ipaddress.ip_address(value)) if value else None
+    except ValueError:
+        return None
+
+
+def record(req, action: str, entity_type: str, entity_id: Optional[int], changes: Optional[dict] = None) -> None:
+    '''Добавляет запись в буфер запроса; в БД она попадёт только вместе с req.commit()'''
+    timings = instrumentation.current()
+    req.audit.append((
+        req.user['user_id'] if req.user else None,
+        req.user['role'] if req.user else None,
+        action,
+        entity_type,
+        int(entity_id) if entity_id is not None else None,
+        json.dumps(changes or {}),
+        timings.request_id if timings else None,
+        _ip(req.client_ip)
+    ))
+
+
+def flush(cursor, entries: list) -> None:
+    '''Все записи вызова одним многострочным INSERT'''
+    from psycopg2.extras import execute_values
+
+    execute_values(cursor, """
+        INSERT INTO audit_log (user_id, role, action, entity_type, entity_id, changes, request_id, ip)
+        VALUES %s
+    """, entries, template='(%s, %s, %s, %s, %s, %s::jsonb, %s, %s::inet)', page_size=len(entries))
+
+
+def ensure_partitions(months_ahead: int = config.AUDIT_PARTITIONS_AHEAD) -> int:
+    '''Создаёт недостающие месячные секции audit_log; вызывается по таймеру из backend/maintenance'''
+    from shared.db import get_pool
+
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT ensure_audit_partitions(%s)", (months_ahead,))
+            created = cursor.fetchone()[0]
+        conn.commit()
+    finally:
+        pool.release(conn)
+    return created
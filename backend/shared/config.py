@@ -0,0 +1,62 @@
+'''Настройки функций: окружение читается один раз при импорте, в холодный старт'''
+import os
+
+DATABASE_URL = os.environ.get('DATABASE_URL', '')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+DB_PREPARE = os.environ.get('DB_PREPARE', '1') == '1'
+
+JWT_SECRET = os.environ.get('JWT_SECRET', 'starry-sky-secret-key')
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '1024'))
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', '300'))
+ACCESS_TOKEN_TTL = int(os.environ.get('ACCESS_TOKEN_TTL', '900'))
+REFRESH_TOKEN_TTL = int(os.environ.get('REFRESH_TOKEN_TTL', str(30 * 24 * 3600)))
+DENYLIST_REFRESH = float(os.environ.get('DENYLIST_REFRESH', '5'))
+TOKENS_PRUNE_BATCH = int(os.environ.get('TOKENS_PRUNE_BATCH', '5000'))
+
+# Роли, которые можно выбрать при самостоятельной регистрации; остальные назначаются в users вручную
+REGISTER_ROLES = tuple(role.strip() for role in os.environ.get('REGISTER_ROLES', 'user').split(',') if role.strip())
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', '4'))
+
+PAGE_SIZE_DEFAULT = int(os.environ.get('PAGE_SIZE_DEFAULT', '100'))
+PAGE_SIZE_MAX = int(os.environ.get('PAGE_SIZE_MAX', '500'))
+
+MODULES_CACHE_SIZE = int(os.environ.get('MODULES_CACHE_SIZE', '256'))
+MODULES_CACHE_TTL = float(os.environ.get('MODULES_CACHE_TTL', '600'))
+
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', '500'))
+
+DASHBOARD_SERVICES_MAX = int(os.environ.get('DASHBOARD_SERVICES_MAX', '100'))
+
+REQUEST_LOG = os.environ.get('REQUEST_LOG', '1') == '1'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_MAX_CHARS = int(os.environ.get('SLOW_QUERY_MAX_CHARS', '500'))
+
+WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', '100'))
+WEBHOOK_CONCURRENCY = int(os.environ.get('WEBHOOK_CONCURRENCY', '20'))
+WEBHOOK_PER_HOST = int(os.environ.get('WEBHOOK_PER_HOST', '4'))
+WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', '10'))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '8'))
+WEBHOOK_BACKOFF_BASE = float(os.environ.get('WEBHOOK_BACKOFF_BASE', '5'))
+WEBHOOK_BACKOFF_MAX = float(os.environ.get('WEBHOOK_BACKOFF_MAX', '3600'))
+WEBHOOK_LEASE = float(os.environ.get('WEBHOOK_LEASE', '60'))
+WEBHOOK_DRAIN_SECONDS = float(os.environ.get('WEBHOOK_DRAIN_SECONDS', '25'))
+WEBHOOK_ALLOW_PRIVATE = os.environ.get('WEBHOOK_ALLOW_PRIVATE', '0') == '1'
+WEBHOOK_RETENTION_DAYS = float(os.environ.get('WEBHOOK_RETENTION_DAYS', '7'))
+WEBHOOK_PRUNE_BATCH = int(os.environ.get('WEBHOOK_PRUNE_BATCH', '5000'))
+
+CRON_SECRET = os.environ.get('CRON_SECRET', '')
+MAINTENANCE_SECONDS = float(os.environ.get('MAINTENANCE_SECONDS', '25'))
+
+AUDIT_PARTITIONS_AHEAD = int(os.environ.get('AUDIT_PARTITIONS_AHEAD', '3'))
+
+LOGIN_RATE_WINDOW = float(os.environ.get('LOGIN_RATE_WINDOW', '60'))
+LOGIN_RATE_USER = int(os.environ.get('LOGIN_RATE_USER', '10'))
+LOGIN_RATE_IP = int(os.environ.get('LOGIN_RATE_IP', '50'))
+LOGIN_RATE_BUCKETS = int(os.environ.get('LOGIN_RATE_BUCKETS', '10000'))
+LOGIN_ATTEMPTS_PRUNE_BATCH = int(os.environ.get('LOGIN_ATTEMPTS_PRUNE_BATCH', '5000'))
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '0'))
+
+SECRETS_MASTER_KEY = os.environ.get('SECRETS_MASTER_KEY', '')
@@ -0,0 +1,174 @@
+import json
+import threading
+import time
+from typing import Optional
+
+import psycopg2
+import psycopg2.extensions
+
+from shared import config
+from shared.instrumentation import current, logger, params_shape, phase, statement
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    '''Курсор, который относит своё время к фазе db и пишет медленные запросы в лог'''
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            timings = current()
+            if timings is not None:
+                timings.add('db', elapsed)
+                timings.queries += 1
+            if elapsed * 1000 >= config.SLOW_QUERY_MS:
+                logger.warning(json.dumps({
+                    'type': 'slow_query',
+                    'requestId': timings.request_id if timings else None,
+                    'durationMs': round(elapsed * 1000, 3),
+                    'statement': statement(query),
+                    'params': params_shape(vars)
+                }, ensure_ascii=False))
+
+    def fetchone(self):
+        with phase('db'):
+            return super().fetchone()
+
+    def fetchmany(self, size=None):
+        with phase('db'):
+            return super().fetchmany(self.itersize if size is None else size)
+
+    def fetchall(self):
+        with phase('db'):
+            return super().fetchall()
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany()
+            if not rows:
+                return
+            yield from rows
+
+
+class Connection(psycopg2.extensions.connection):
+    '''Соединение помнит имена запросов, уже подготовленных на нём через PREPARE'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class ConnectionPool:
+    '''Пул соединений с PostgreSQL, живущий между тёплыми вызовами функции'''
+
+    def __init__(self, dsn: str, size: int = 2, ping_after: float = 30.0):
+        self.dsn = dsn
+        self.size = size
+        self.ping_after = ping_after
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self._idle = []
+        self._broken = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''Выдаёт живое соединение из пула или открывает новое'''
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, released_at = self._idle.pop()
+            if self._is_healthy(conn, released_at):
+                with self._lock:
+                    self.hits += 1
+                return conn
+            self._close(conn)
+            with self._lock:
+                self._broken += 1
+
+        with phase('db_connect'):
+            conn = psycopg2.connect(self.dsn, connection_factory=Connection, cursor_factory=InstrumentedCursor)
+        with self._lock:
+            self.misses += 1
+            if self._broken:
+                self._broken -= 1
+                self.reconnects += 1
+        return conn
+
+    def release(self, conn) -> None:
+        '''Возвращает соединение в пул; сломанные и лишние закрываются'''
+        if conn.closed:
+            with self._lock:
+                self._broken += 1
+            return
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._close(conn)
+            with self._lock:
+                self._broken += 1
+            return
+
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        self._close(conn)
+
+    def stats(self) -> dict:
+        '''Счётчики переиспользования соединений'''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'reconnects': self.reconnects,
+                'idle': len(self._idle),
+                'size': self.size
+            }
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+    def _is_healthy(self, conn, released_at: float) -> bool:
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - released_at < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close(conn) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+_pool: Optional[ConnectionPool] = None
+
+
+def get_pool() -> ConnectionPool:
+    '''Ленивая инициализация пула при первом обращении в контейнере'''
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(
+            config.DATABASE_URL,
+            size=config.DB_POOL_SIZE,
+            ping_after=config.DB_POOL_PING_AFTER
+        )
+    return _pool
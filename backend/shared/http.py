@@ -0,0 +1,259 @@
+import hashlib
+import hmac
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Optional
+
+from shared import audit, config, instrumentation
+from shared.tokens import verify_token
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+CORS_ALLOW_HEADERS = 'Content-Type, X-Auth-Token, If-None-Match'
+TIMER_EVENT_TYPE = 'yandex.cloud.events.serverless.triggers.TimerMessage'
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+try:
+    import orjson
+
+    def dumps(data) -> str:
+        '''Единая точка сериализации ответов: orjson, если установлен'''
+        return orjson.dumps(data, default=_default).decode('utf-8')
+except ImportError:
+    def dumps(data) -> str:
+        '''Единая точка сериализации ответов: orjson, если установлен'''
+        return json.dumps(data, default=_default)
+
+
+class HttpError(Exception):
+    '''Ошибка, которую роутер превращает в ответ с нужным статусом'''
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def serialize(data) -> str:
+    with instrumentation.phase('serialize'):
+        return dumps(data)
+
+
+def response(status: int, data, headers: Optional[dict] = None) -> dict:
+    '''Ответ в формате облачной функции; общий JSON_HEADERS не копируется и не должен меняться'''
+    return {
+        'statusCode': status,
+        'headers': {**JSON_HEADERS, **headers} if headers else JSON_HEADERS,
+        'body': serialize(data),
+        'isBase64Encoded': False
+    }
+
+
+def error(status: int, message: str) -> dict:
+    return response(status, {'error': message})
+
+
+def make_etag(*parts) -> str:
+    '''Сильный ETag из дешёвых признаков версии данных, без сериализации тела'''
+    digest = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_headers(etag: str) -> dict:
+    return {'ETag': etag, 'Access-Control-Expose-Headers': 'ETag'}
+
+
+def not_modified(req: 'Request', etag: str) -> Optional[dict]:
+    '''304 без тела, если If-None-Match совпал с текущим ETag'''
+    header = req.header('If-None-Match')
+    if not header:
+        return None
+    tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    if etag not in tags and '*' not in tags:
+        return None
+    return {
+        'statusCode': 304,
+        'headers': {'Access-Control-Allow-Origin': '*', **etag_headers(etag)},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+
+def _pool():
+    '''Драйвер БД импортируется с первым запросом, которому нужно соединение, а не при холодном старте'''
+    from shared.db import get_pool
+
+    return get_pool()
+
+
+class Request:
+    '''Разобранное событие вызова; соединение с БД берётся из пула только по требованию'''
+
+    __slots__ = ('event', 'method', 'headers', 'query', 'user', 'audit', '_body', '_conn', '_cursor')
+
+    def __init__(self, event: dict):
+        self.event = event
+        self.method = event.get('httpMethod', 'GET')
+        self.headers = event.get('headers') or {}
+        self.query = event.get('queryStringParameters') or {}
+        self.user = None
+        self.audit = []
+        self._body = None
+        self._conn = None
+        self._cursor = None
+
+    @property
+    def body(self) -> dict:
+        if self._body is None:
+            self._body = json.loads(self.event.get('body') or '{}')
+        return self._body
+
+    @property
+    def action(self) -> Optional[str]:
+        if self.method in ('POST', 'PUT', 'DELETE') and self.event.get('body'):
+            body = self.body
+            if isinstance(body, dict) and body.get('action'):
+                return body['action']
+        return self.query.get('action')
+
+    @property
+    def token(self) -> Optional[str]:
+        return self.headers.get('X-Auth-Token')
+
+    @property
+    def client_ip(self) -> Optional[str]:
+        '''Адрес клиента из requestContext шлюза; иначе запись, которую дописал свой прокси, или None
+
+        Начало X-Forwarded-For задаёт клиент, поэтому из заголовка берётся только
+        TRUSTED_PROXY_HOPS-я запись с конца; без доверенных прокси лимит по IP не применяется.
+        '''
+        identity = (self.event.get('requestContext') or {}).get('identity') or {}
+        if identity.get('sourceIp'):
+            return identity['sourceIp']
+        forwarded = self.header('X-Forwarded-For')
+        if not forwarded or config.TRUSTED_PROXY_HOPS < 1:
+            return None
+        hops = [part.strip() for part in forwarded.split(',')]
+        if len(hops) < config.TRUSTED_PROXY_HOPS:
+            return None
+        return hops[-config.TRUSTED_PROXY_HOPS] or None
+
+    def header(self, name: str) -> Optional[str]:
+        value = self.headers.get(name)
+        if value is None:
+            value = self.headers.get(name.lower())
+        return value
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = _pool().acquire()
+        return self._conn
+
+    @property
+    def cursor(self):
+        if self._cursor is None:
+            self._cursor = self.conn.cursor()
+        return self._cursor
+
+    def commit(self) -> None:
+        '''Фиксирует транзакцию; накопленные записи журнала входят в неё же одним INSERT'''
+        if self.audit:
+            audit.flush(self.cursor, self.audit)
+            self.audit = []
+        self.conn.commit()
+
+    def close(self) -> None:
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+        if self._conn is not None:
+            _pool().release(self._conn)
+            self._conn = None
+
+
+class Router:
+    '''Таблица маршрутов (метод, action) -> обработчик'''
+
+    def __init__(self, auth: bool = True):
+        self.auth = auth
+        self._routes = {}
+        self._preflight = None
+
+    def route(self, method: str, action: Optional[str] = None) -> Callable:
+        def register(fn: Callable) -> Callable:
+            self._routes[(method, action)] = fn
+            self._preflight = None
+            return fn
+        return register
+
+    def preflight(self) -> dict:
+        if self._preflight is None:
+            methods = sorted({method for method, _ in self._routes})
+            self._preflight = {
+                'statusCode': 200,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': ', '.join(methods + ['OPTIONS']),
+                    'Access-Control-Allow-Headers': CORS_ALLOW_HEADERS
+                },
+                'body': '',
+                'isBase64Encoded': False
+            }
+        return self._preflight
+
+    def dispatch(self, event: dict, context) -> dict:
+        req = Request(event)
+        if req.method == 'OPTIONS':
+            return self.preflight()
+
+        timings = instrumentation.begin(context)
+        action = None
+        try:
+            action = req.action
+            result = self._handle(req, action)
+        except HttpError as e:
+            result = error(e.status, str(e))
+        except Exception as e:
+            instrumentation.fail(e)
+            result = error(500, str(e))
+        finally:
+            req.close()
+        return instrumentation.finish(timings, req, action, result)
+
+    def _handle(self, req: Request, action: Optional[str]) -> dict:
+        if self.auth:
+            if not req.token:
+                return error(401, 'No token provided')
+            req.user = verify_token(req.token)
+            if not req.user:
+                return error(401, 'Invalid token')
+
+        route = self._routes.get((req.method, action)) or self._routes.get((req.method, None))
+        if route is None:
+            return error(405, 'Method not allowed')
+        return route(req)
+
+
+def scheduled(event: dict) -> bool:
+    '''Вызов таймер-триггером или HTTP-запрос с X-Cron-Secret, равным CRON_SECRET
+
+    HTTP-вызов всегда несёт httpMethod, поэтому событие таймера через шлюз не подделать;
+    без CRON_SECRET фоновые функции по HTTP не запускаются вовсе.
+    '''
+    if 'httpMethod' not in event:
+        messages = event.get('messages') or [{}]
+        return all(
+            (message.get('event_metadata') or {}).get('event_type') == TIMER_EVENT_TYPE for message in messages
+        )
+    secret = Request(event).header('X-Cron-Secret')
+    return bool(config.CRON_SECRET and secret) and hmac.compare_digest(
+        secret.encode('utf-8'), config.CRON_SECRET.encode('utf-8')
+    )
@@ -0,0 +1,148 @@
+'''Замеры фаз вызова: строка лога на вызов, заголовок Server-Timing и журнал медленных запросов
+
+Модуль нужен каждому вызову, включая OPTIONS, поэтому не импортирует драйвер БД:
+курсор с замерами живёт в shared/db.py.
+'''
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from shared import config
+
+logger = logging.getLogger('starry')
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_current = threading.local()
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'")
+_SPACES = re.compile(r'\s+')
+
+
+class Timings:
+    '''Накопленное время фаз одного вызова, в секундах'''
+
+    __slots__ = ('request_id', 'started', 'spent', 'queries', 'error')
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spent = {}
+        self.queries = 0
+        self.error = None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.spent[name] = self.spent.get(name, 0.0) + seconds
+
+
+def current() -> Optional[Timings]:
+    return getattr(_current, 'timings', None)
+
+
+def record(name: str, seconds: float) -> None:
+    timings = current()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+class phase:
+    '''with phase('crypto'): ... — добавляет время блока к фазе текущего вызова'''
+
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def begin(context=None) -> Timings:
+    request_id = getattr(context, 'request_id', None) or os.urandom(8).hex()
+    timings = Timings(request_id)
+    _current.timings = timings
+    return timings
+
+
+def fail(exc: BaseException) -> None:
+    '''Запоминает исключение, которое обработчик превратил в 500'''
+    timings = current()
+    if timings is not None:
+        timings.error = {
+            'type': type(exc).__name__,
+            'message': str(exc),
+            'traceback': traceback.format_exc(limit=8)
+        }
+
+
+def finish(timings: Timings, req, action: Optional[str], result: dict) -> dict:
+    '''Пишет строку лога и возвращает ответ с Server-Timing (исходный словарь не меняется)'''
+    _current.timings = None
+    total = time.perf_counter() - timings.started
+
+    parts = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings.spent.items()]
+    parts.append(f'total;dur={total * 1000:.2f}')
+    result = {
+        **result,
+        'headers': {**result['headers'], 'Server-Timing': ', '.join(parts), 'Timing-Allow-Origin': '*'}
+    }
+
+    if config.REQUEST_LOG:
+        line = {
+            'type': 'request',
+            'requestId': timings.request_id,
+            'method': req.method,
+            'action': action,
+            'status': result['statusCode'],
+            'durationMs': round(total * 1000, 3),
+            'phasesMs': {name: round(seconds * 1000, 3) for name, seconds in timings.spent.items()},
+            'queries': timings.queries
+        }
+        if timings.error:
+            line['error'] = timings.error
+        logger.info(json.dumps(line, ensure_ascii=False))
+    return result
+
+
+def params_shape(params):
+    '''Типы и размеры параметров без значений'''
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: _shape(value) for key, value in params.items()}
+    return [_shape(value) for value in params]
+
+
+def _shape(value) -> str:
+    if value is None:
+        return 'null'
+    if isinstance(value, (str, bytes)):
+        return f'{type(value).__name__}({len(value)})'
+    if isinstance(value, (list, tuple)):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
+
+
+def statement(query) -> str:
+    '''Текст запроса для журнала: без литералов, в одну строку, обрезанный'''
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    elif not isinstance(query, str):
+        query = str(query)
+    query = _SPACES.sub(' ', _LITERALS.sub("'?'", query)).strip()
+    return query[:config.SLOW_QUERY_MAX_CHARS]
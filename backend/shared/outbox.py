@@ -0,0 +1,52 @@
+'''Транзакционный outbox: события пишутся в webhook_outbox той же транзакцией, что и изменение'''
+import json
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+from shared import config
+from shared.queries import ENQUEUE_FOR_INTEGRATIONS, ENQUEUE_FOR_USER
+
+
+def enqueue(cursor, user_id: int, event_type: str, data: dict) -> None:
+    '''Событие для всех активных интеграций пользователя с webhook_url — одним INSERT'''
+    ENQUEUE_FOR_USER.run(cursor, (event_type, json.dumps(data), user_id))
+
+
+def enqueue_for_integrations(cursor, user_id: int, event_type: str, integration_ids: Iterable[int]) -> None:
+    '''Событие о самих интеграциях; данные собираются из строки integrations без api_key'''
+    ids = [int(integration_id) for integration_id in integration_ids]
+    if not ids:
+        return
+    ENQUEUE_FOR_INTEGRATIONS.run(cursor, (event_type, user_id, ids))
+
+
+def is_public_address(value: str) -> bool:
+    '''Глобальный адрес: не loopback, не частная сеть, не link-local (169.254.169.254 — метаданные облака)'''
+    import ipaddress
+
+    address = ipaddress.ip_address(value.split('%', 1)[0])
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.is_global and not address.is_multicast
+
+
+def webhook_url_error(url) -> Optional[str]:
+    '''Причина, по которой webhook_url не принимается, или None; имя хоста проверяет резолвер доставки'''
+    if not isinstance(url, str):
+        return 'webhookUrl must be a string'
+    try:
+        parts = urlsplit(url)
+        host, _ = parts.hostname, parts.port
+    except ValueError:
+        return 'Invalid webhookUrl'
+    if parts.scheme not in ('http', 'https') or not host:
+        return 'webhookUrl must be an http(s) URL'
+    if config.WEBHOOK_ALLOW_PRIVATE:
+        return None
+    if host == 'localhost' or host.endswith('.localhost'):
+        return 'webhookUrl must not point to a private address'
+    try:
+        public = is_public_address(host)
+    except ValueError:
+        return None
+    return None if public else 'webhookUrl must not point to a private address'
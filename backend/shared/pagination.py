@@ -0,0 +1,84 @@
+import base64
+import io
+import time
+from datetime import datetime
+from typing import Callable, Iterable, Optional, Tuple
+
+from shared import config, instrumentation
+from shared.http import JSON_HEADERS, HttpError, dumps
+
+
+class InvalidPage(HttpError):
+    def __init__(self, message: str):
+        super().__init__(400, message)
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{row_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise InvalidPage('Invalid cursor')
+
+
+def page_params(query: dict) -> Tuple[int, Optional[Tuple[datetime, int]]]:
+    '''limit и позиция после курсора из query-параметров'''
+    try:
+        limit = int(query.get('limit') or config.PAGE_SIZE_DEFAULT)
+    except ValueError:
+        raise InvalidPage('Invalid limit')
+    if limit < 1:
+        raise InvalidPage('Invalid limit')
+    limit = min(limit, config.PAGE_SIZE_MAX)
+
+    cursor = query.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def stream_page(rows: Iterable, key: str, serialize: Callable[[object], dict], limit: int,
+                headers: Optional[dict] = None) -> dict:
+    '''Пишет строки в JSON по мере чтения из курсора, не собирая список словарей
+
+    У записей должны быть поля created_at и id для следующего курсора;
+    строк в выборке должно быть не больше limit + 1.
+    '''
+    timings = instrumentation.current()
+    started = time.perf_counter()
+    db_before = timings.spent.get('db', 0.0) if timings else 0.0
+
+    out = io.StringIO()
+    out.write('{')
+    out.write(dumps(key))
+    out.write(':[')
+
+    last = None
+    next_cursor = None
+    for count, row in enumerate(rows):
+        if count == limit:
+            next_cursor = encode_cursor(last.created_at, last.id)
+            break
+        if count:
+            out.write(',')
+        out.write(dumps(serialize(row)))
+        last = row
+
+    out.write('],"nextCursor":')
+    out.write(dumps(next_cursor))
+    out.write('}')
+
+    if timings:
+        fetched = timings.spent.get('db', 0.0) - db_before
+        timings.add('serialize', time.perf_counter() - started - fetched)
+
+    return {
+        'statusCode': 200,
+        'headers': {**JSON_HEADERS, **headers} if headers else JSON_HEADERS,
+        'body': out.getvalue(),
+        'isBase64Encoded': False
+    }
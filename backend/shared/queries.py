@@ -0,0 +1,394 @@
+'''Фиксированные запросы обработчиков: PREPARE один раз на соединение, строки — записи со __slots__'''
+import re
+import threading
+import time
+from typing import Iterator, Optional
+
+from shared import config
+
+_PLACEHOLDERS = re.compile(r'%([s%])')
+
+_registry = {}
+_lock = threading.Lock()
+
+
+class Record:
+    '''Строка результата с доступом по именам; поля — __slots__ подкласса в порядке столбцов'''
+
+    __slots__ = ()
+
+    def __init__(self, row: tuple):
+        for name, value in zip(self.__slots__, row):
+            setattr(self, name, value)
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+class Query:
+    '''Именованный запрос с %s-параметрами; на соединении из пула выполняется как EXECUTE'''
+
+    __slots__ = ('name', 'sql', 'record', 'prepare', 'prepare_sql', 'execute_sql', 'calls', 'seconds')
+
+    def __init__(self, name: str, sql: str, record: Optional[type] = None, prepare: bool = True):
+        if name in _registry:
+            raise ValueError(f'Query {name} is already defined')
+        self.name = name
+        self.sql = sql
+        self.record = record
+        self.prepare = prepare
+        self.calls = 0
+        self.seconds = 0.0
+
+        count = 0
+
+        def number(match) -> str:
+            nonlocal count
+            if match.group(1) == '%':
+                return '%'
+            count += 1
+            return f'${count}'
+
+        self.prepare_sql = f'PREPARE {name} AS {_PLACEHOLDERS.sub(number, sql)}'
+        self.execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * count)})" if count else f'EXECUTE {name}'
+        _registry[name] = self
+
+    def execute(self, cursor, params: tuple = ()):
+        '''Выполняет запрос на курсоре и возвращает его; PREPARE — при первом вызове на соединении'''
+        started = time.perf_counter()
+        try:
+            prepared = getattr(cursor.connection, 'prepared', None)
+            if prepared is None or not self.prepare or not config.DB_PREPARE:
+                cursor.execute(self.sql, params)
+            else:
+                if self.name not in prepared:
+                    cursor.execute(self.prepare_sql)
+                    prepared.add(self.name)
+                cursor.execute(self.execute_sql, params)
+        finally:
+            elapsed = time.perf_counter() - started
+            with _lock:
+                self.calls += 1
+                self.seconds += elapsed
+        return cursor
+
+    def one(self, cursor, params: tuple = ()):
+        row = self.execute(cursor, params).fetchone()
+        if row is None or self.record is None:
+            return row
+        return self.record(row)
+
+    def all(self, cursor, params: tuple = ()) -> list:
+        rows = self.execute(cursor, params).fetchall()
+        if self.record is None:
+            return rows
+        return [self.record(row) for row in rows]
+
+    def iter(self, cursor, params: tuple = ()) -> Iterator:
+        '''Записи по мере чтения из курсора, без промежуточного списка'''
+        record = self.record
+        for row in self.execute(cursor, params):
+            yield record(row) if record else row
+
+    def scalar(self, cursor, params: tuple = ()):
+        '''Первый столбец первой строки или None'''
+        row = self.execute(cursor, params).fetchone()
+        return row[0] if row else None
+
+    def run(self, cursor, params: tuple = ()) -> int:
+        '''Запрос без результата; возвращает число затронутых строк'''
+        return self.execute(cursor, params).rowcount
+
+
+def stats() -> dict:
+    '''Число вызовов и суммарное время по каждому запросу, начиная с холодного старта'''
+    with _lock:
+        return {
+            name: {'calls': query.calls, 'totalMs': round(query.seconds * 1000, 3)}
+            for name, query in _registry.items() if query.calls
+        }
+
+
+def reset_stats() -> None:
+    with _lock:
+        for query in _registry.values():
+            query.calls = 0
+            query.seconds = 0.0
+
+
+class UserCredentials(Record):
+    __slots__ = ('id', 'password_hash', 'role')
+
+
+class UserClaims(Record):
+    __slots__ = ('id', 'email', 'role')
+
+
+class Module(Record):
+    __slots__ = ('id', 'name', 'icon', 'is_premium', 'is_active', 'allowed_roles', 'owner_id', 'created_at')
+
+
+class Entitlement(Record):
+    __slots__ = ('user_id', 'id', 'name', 'icon', 'is_premium', 'is_owner', 'enabled', 'settings')
+
+
+class Integration(Record):
+    __slots__ = ('id', 'service_name', 'webhook_url', 'settings', 'is_active', 'created_at')
+
+
+class IntegrationDetail(Record):
+    __slots__ = ('id', 'service_name', 'has_api_key', 'webhook_url', 'settings', 'is_active', 'updated_at')
+
+
+class DashboardSummary(Record):
+    __slots__ = (
+        'modules_total', 'modules_active', 'modules_premium', 'modules_active_premium',
+        'integrations_total', 'integrations_active', 'services'
+    )
+
+
+class AuditEntry(Record):
+    __slots__ = (
+        'id', 'created_at', 'user_id', 'role', 'action', 'entity_type', 'entity_id', 'changes', 'request_id', 'ip'
+    )
+
+
+USER_BY_EMAIL = Query('user_by_email', """
+    SELECT id, password_hash, role FROM users WHERE email = %s
+""", UserCredentials)
+
+INSERT_USER = Query('insert_user', """
+    INSERT INTO users (email, password_hash, role) VALUES (%s, %s, %s) RETURNING id
+""")
+
+UPDATE_PASSWORD = Query('update_password', """
+    UPDATE users SET password_hash = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s
+""")
+
+CURRENT_VERSION = Query('current_version', """
+    SELECT version FROM cache_versions WHERE name = %s
+""")
+
+BUMP_VERSION = Query('bump_version', """
+    INSERT INTO cache_versions (name, version) VALUES (%s, 1)
+    ON CONFLICT (name) DO UPDATE
+    SET version = cache_versions.version + 1, updated_at = CURRENT_TIMESTAMP
+    RETURNING version
+""")
+
+_MODULES_PAGE = """
+    SELECT id, name, icon, is_premium, is_active, allowed_roles, owner_id, created_at
+    FROM modules
+    WHERE (owner_id = %s OR allowed_roles @> ARRAY[%s::text]) {condition}
+    ORDER BY created_at DESC, id DESC
+    LIMIT %s
+"""
+
+MODULES_FIRST_PAGE = Query('modules_first_page', _MODULES_PAGE.format(condition=''), Module)
+
+MODULES_PAGE_AFTER = Query('modules_page_after', _MODULES_PAGE.format(
+    condition='AND (created_at, id) < (%s, %s)'
+), Module)
+
+INSERT_MODULE = Query('insert_module', """
+    INSERT INTO modules (name, icon, is_premium, is_active, allowed_roles, owner_id)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    RETURNING id
+""")
+
+UPDATE_MODULE = Query('update_module', """
+    UPDATE modules
+    SET name = %s, icon = %s, is_premium = %s, is_active = %s,
+        allowed_roles = %s, updated_at = CURRENT_TIMESTAMP
+    WHERE id = %s AND owner_id = %s
+""")
+
+ENTITLEMENTS = Query('entitlements', """
+    SELECT u.id, m.id, m.name, m.icon, m.is_premium, m.owner_id = u.id,
+           COALESCE(um.is_active, true), COALESCE(um.settings, '{}'::jsonb)
+    FROM users u
+    JOIN modules m ON m.is_active AND (m.owner_id = u.id OR m.allowed_roles @> ARRAY[u.role]::text[])
+    LEFT JOIN user_modules um ON um.user_id = u.id AND um.module_id = m.id
+    WHERE u.id = ANY(%s::int[])
+    ORDER BY u.id, m.id
+""", Entitlement)
+
+INTEGRATIONS_STATE = Query('integrations_state', """
+    SELECT max(updated_at), count(*) FROM integrations WHERE user_id = %s
+""")
+
+_INTEGRATIONS_PAGE = """
+    SELECT id, service_name, webhook_url, settings, is_active, created_at
+    FROM integrations
+    WHERE user_id = %s {condition}
+    ORDER BY created_at DESC, id DESC
+    LIMIT %s
+"""
+
+INTEGRATIONS_FIRST_PAGE = Query('integrations_first_page', _INTEGRATIONS_PAGE.format(condition=''), Integration)
+
+INTEGRATIONS_PAGE_AFTER = Query('integrations_page_after', _INTEGRATIONS_PAGE.format(
+    condition='AND (created_at, id) < (%s, %s)'
+), Integration)
+
+# Без PREPARE: обобщённый план оценивает user_id = $1 в одну строку и выбирает
+# idx_integrations_user_created вместо уникального (user_id, service_name), а у крупных
+# арендаторов это тысячи отфильтрованных строк.
+INTEGRATION_BY_SERVICE = Query('integration_by_service', """
+    SELECT id, service_name, api_key_fingerprint IS NOT NULL OR api_key IS NOT NULL,
+           webhook_url, settings, is_active, updated_at
+    FROM integrations
+    WHERE user_id = %s AND service_name = %s
+""", IntegrationDetail, prepare=False)
+
+INSERT_INTEGRATION = Query('insert_integration', """
+    INSERT INTO integrations
+    (user_id, service_name, api_key_encrypted, api_key_fingerprint, webhook_url, settings, is_active)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    RETURNING id
+""")
+
+UPDATE_INTEGRATION = Query('update_integration', """
+    UPDATE integrations
+    SET api_key_encrypted = COALESCE(%s, api_key_encrypted),
+        api_key_fingerprint = COALESCE(%s, api_key_fingerprint),
+        api_key = CASE WHEN %s::bytea IS NULL THEN api_key END,
+        webhook_url = COALESCE(%s, webhook_url),
+        settings = COALESCE(%s, settings),
+        is_active = COALESCE(%s, is_active),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = %s AND user_id = %s
+""")
+
+# Счётчики из V0010__create_dashboard_counts: не больше восьми строк module_counts
+# (роль + модули владельца вне allowed_roles), одна строка итогов и первые N сервисов.
+DASHBOARD_SUMMARY = Query('dashboard_summary', """
+    SELECT COALESCE(sum(m.modules), 0),
+           COALESCE(sum(m.modules) FILTER (WHERE m.is_active), 0),
+           COALESCE(sum(m.modules) FILTER (WHERE m.is_premium), 0),
+           COALESCE(sum(m.modules) FILTER (WHERE m.is_active AND m.is_premium), 0),
+           COALESCE((SELECT total FROM integration_totals WHERE user_id = %s), 0),
+           COALESCE((SELECT active FROM integration_totals WHERE user_id = %s), 0),
+           (SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                        'service', s.service_name, 'total', s.total, 'active', s.active
+                    ) ORDER BY s.service_name), '[]'::jsonb)
+            FROM (
+                SELECT service_name, total, active
+                FROM integration_counts
+                WHERE user_id = %s AND total > 0
+                ORDER BY service_name
+                LIMIT %s
+            ) s)
+    FROM module_counts m
+    WHERE m.role = %s AND m.owner_id IN (0, %s)
+""", DashboardSummary)
+
+ENQUEUE_FOR_USER = Query('enqueue_for_user', """
+    INSERT INTO webhook_outbox (integration_id, event_type, payload)
+    SELECT id, %s, %s::jsonb
+    FROM integrations
+    WHERE user_id = %s AND is_active AND webhook_url IS NOT NULL
+""")
+
+ENQUEUE_FOR_INTEGRATIONS = Query('enqueue_for_integrations', """
+    INSERT INTO webhook_outbox (integration_id, event_type, payload)
+    SELECT id, %s, jsonb_build_object(
+        'id', id,
+        'service', service_name,
+        'settings', settings - 'webhookSecret',
+        'isActive', is_active
+    )
+    FROM integrations
+    WHERE user_id = %s AND id = ANY(%s::int[]) AND webhook_url IS NOT NULL
+""")
+
+COUNT_LOGIN_ATTEMPTS = Query('count_login_attempts', """
+    INSERT INTO login_attempts AS a (key, window_start, attempts)
+    SELECT key, to_timestamp(floor(extract(epoch FROM now()) / %s) * %s), 1
+    FROM unnest(%s::text[]) AS key
+    ON CONFLICT (key) DO UPDATE
+    SET attempts = CASE WHEN a.window_start = EXCLUDED.window_start THEN a.attempts + 1 ELSE 1 END,
+        window_start = EXCLUDED.window_start
+    RETURNING key, attempts, extract(epoch FROM window_start - now())::float8 + %s
+""")
+
+# Окно строки закончилось — следующий upsert всё равно начал бы счёт с 1. Внешнее условие
+# перепроверяется после блокировки, поэтому строку, которую upsert успел перевести в новое окно, не удалить.
+PRUNE_LOGIN_ATTEMPTS = Query('prune_login_attempts', """
+    DELETE FROM login_attempts
+    WHERE key IN (
+        SELECT key
+        FROM login_attempts
+        WHERE window_start < now() - %s * interval '1 second'
+        ORDER BY window_start
+        LIMIT %s
+    ) AND window_start < now() - %s * interval '1 second'
+""")
+
+INSERT_REFRESH_TOKEN = Query('insert_refresh_token', """
+    INSERT INTO refresh_tokens (user_id, token_hash, family_id, expires_at)
+    VALUES (%s, %s, %s, now() + %s * interval '1 second')
+""")
+
+ROTATE_REFRESH_TOKEN = Query('rotate_refresh_token', """
+    WITH used AS (
+        UPDATE refresh_tokens r
+        SET revoked_at = now()
+        FROM users u
+        WHERE r.token_hash = %s AND r.revoked_at IS NULL AND r.expires_at > now() AND u.id = r.user_id
+        RETURNING r.user_id, r.family_id, u.email, u.role
+    ), issued AS (
+        INSERT INTO refresh_tokens (user_id, token_hash, family_id, expires_at)
+        SELECT user_id, %s, family_id, now() + %s * interval '1 second' FROM used
+    )
+    SELECT user_id, email, role FROM used
+""", UserClaims)
+
+REVOKE_REFRESH_FAMILY = Query('revoke_refresh_family', """
+    UPDATE refresh_tokens
+    SET revoked_at = now()
+    WHERE family_id = (SELECT family_id FROM refresh_tokens WHERE token_hash = %s) AND revoked_at IS NULL
+""")
+
+REVOKE_USER_REFRESH_TOKENS = Query('revoke_user_refresh_tokens', """
+    UPDATE refresh_tokens SET revoked_at = now() WHERE user_id = %s AND revoked_at IS NULL
+""")
+
+REVOKE_ACCESS_TOKEN = Query('revoke_access_token', """
+    INSERT INTO revoked_tokens (jti, expires_at) VALUES (%s, to_timestamp(%s))
+    ON CONFLICT (jti) DO NOTHING
+""")
+
+# Строка семьи удаляется, только когда истекла вся семья: иначе повторное предъявление старого
+# погашенного токена перестало бы гасить живой токен той же семьи.
+PRUNE_REFRESH_TOKENS = Query('prune_refresh_tokens', """
+    DELETE FROM refresh_tokens
+    WHERE id IN (
+        SELECT r.id
+        FROM refresh_tokens r
+        WHERE r.expires_at < now()
+          AND NOT EXISTS (SELECT 1 FROM refresh_tokens l WHERE l.family_id = r.family_id AND l.expires_at >= now())
+        ORDER BY r.expires_at
+        LIMIT %s
+    )
+""")
+
+# Токен с истёкшим exp не пройдёт проверку и без списка отзыва
+PRUNE_REVOKED_TOKENS = Query('prune_revoked_tokens', """
+    DELETE FROM revoked_tokens
+    WHERE jti IN (
+        SELECT jti
+        FROM revoked_tokens
+        WHERE expires_at < now()
+        ORDER BY expires_at
+        LIMIT %s
+    )
+""")
+
+REVOKED_SINCE = Query('revoked_since', """
+    SELECT jti, extract(epoch FROM expires_at)::float8, revoked_at
+    FROM revoked_tokens
+    WHERE revoked_at >= %s AND expires_at > now()
+    ORDER BY revoked_at
+""")
@@ -0,0 +1,162 @@
+'''Токены доступа и refresh-токены
+
+jwt и драйвер БД импортируются при первом обращении: preflight и запрос без токена
+обходятся без них, а ошибки проверки — собственные классы, а не исключения jwt.
+'''
+import hashlib
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from shared import config
+from shared.cache import TTLCache
+from shared.instrumentation import phase
+from shared.queries import REVOKE_ACCESS_TOKEN, REVOKED_SINCE
+
+JWT_ALGORITHM = 'HS256'
+ACCESS_TOKEN_TYPE = 'access'
+
+# Повторно читаем отзывы за последние секунды: запись могла зафиксироваться позже,
+# чем её revoked_at попал в окно прошлого обновления.
+DENYLIST_OVERLAP = 30.0
+
+_payloads = TTLCache(maxsize=config.TOKEN_CACHE_SIZE, ttl=config.TOKEN_CACHE_TTL)
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class TokenExpired(InvalidToken):
+    pass
+
+
+class TokenRevoked(InvalidToken):
+    pass
+
+
+class DenyList:
+    '''Отозванные jti до их exp; дочитывается из revoked_tokens не чаще раза в refresh_every секунд'''
+
+    def __init__(self, refresh_every: float):
+        self.refresh_every = refresh_every
+        self._denied = {}
+        self._since = datetime.fromtimestamp(0, timezone.utc)
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def __contains__(self, jti: str) -> bool:
+        if time.monotonic() >= self._next_refresh:
+            self.refresh()
+        return jti in self._denied
+
+    def add(self, jti: str, expires_at: float) -> None:
+        with self._lock:
+            self._denied[jti] = expires_at
+
+    def refresh(self) -> None:
+        with self._lock:
+            if time.monotonic() < self._next_refresh:
+                return
+            from shared.db import get_pool
+
+            pool = get_pool()
+            conn = pool.acquire()
+            try:
+                with conn.cursor() as cursor:
+                    rows = REVOKED_SINCE.all(cursor, (self._since - timedelta(seconds=DENYLIST_OVERLAP),))
+                conn.rollback()
+            finally:
+                pool.release(conn)
+
+            now = time.time()
+            self._denied = {jti: exp for jti, exp in self._denied.items() if exp > now}
+            for jti, expires_at, revoked_at in rows:
+                self._denied[jti] = expires_at
+                self._since = max(self._since, revoked_at)
+            self._next_refresh = time.monotonic() + self.refresh_every
+
+    def __len__(self) -> int:
+        return len(self._denied)
+
+
+denylist = DenyList(config.DENYLIST_REFRESH)
+
+
+def _digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+def encode_token(payload: dict) -> str:
+    import jwt
+
+    with phase('crypto'):
+        return jwt.encode(payload, config.JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+
+def issue_access_token(user_id: int, email: str, role: str) -> Tuple[str, dict]:
+    '''Короткий токен доступа; всё, что нужно обработчикам, лежит в самих claims'''
+    now = int(time.time())
+    payload = {
+        'type': ACCESS_TOKEN_TYPE,
+        'jti': secrets.token_hex(12),
+        'user_id': user_id,
+        'email': email,
+        'role': role,
+        'iat': now,
+        'exp': now + config.ACCESS_TOKEN_TTL
+    }
+    return encode_token(payload), payload
+
+
+def new_refresh_token() -> Tuple[str, bytes]:
+    '''Непрозрачный refresh-токен и его sha256 для refresh_tokens.token_hash'''
+    token = secrets.token_urlsafe(32)
+    return token, _digest(token)
+
+
+def refresh_token_hash(token: str) -> bytes:
+    return _digest(token)
+
+
+def decode_token(token: str) -> dict:
+    '''Проверка токена доступа с кэшем и списком отзыва; ошибки — InvalidToken и подклассы'''
+    key = _digest(token)
+    payload = _payloads.get(key)
+    if payload is None:
+        import jwt
+
+        try:
+            with phase('crypto'):
+                payload = jwt.decode(token, config.JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise TokenExpired('Token expired') from None
+        except jwt.InvalidTokenError as e:
+            raise InvalidToken(str(e)) from None
+        if payload.get('type') != ACCESS_TOKEN_TYPE or not payload.get('jti'):
+            raise InvalidToken('Not an access token')
+        _payloads.set(key, payload, expires_at=payload['exp'])
+
+    if payload['jti'] in denylist:
+        raise TokenRevoked('Token revoked')
+    return payload
+
+
+def verify_token(token: str) -> Optional[dict]:
+    '''Проверка JWT токена'''
+    try:
+        return decode_token(token)
+    except InvalidToken:
+        return None
+
+
+def revoke(cursor, payload: dict) -> None:
+    '''Отзывает токен доступа: строка в revoked_tokens и сразу в списке этого контейнера'''
+    REVOKE_ACCESS_TOKEN.run(cursor, (payload['jti'], payload['exp']))
+    denylist.add(payload['jti'], payload['exp'])
+
+
+def cache_stats() -> dict:
+    return {'tokens': _payloads.stats(), 'denied': len(denylist)}
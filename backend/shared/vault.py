@@ -0,0 +1,87 @@
+'''Конвертное шифрование секретов интеграций: ключ данных на каждую запись, обёрнутый мастер-ключом из окружения
+
+Формат api_key_encrypted: версия (1 байт) | nonce мастер-ключа (12) | обёрнутый ключ данных (48)
+| nonce ключа данных (12) | шифротекст с тегом. Associated data привязывает шифротекст к владельцу,
+так что строку нельзя переставить другому пользователю.
+cryptography импортируется с первым шифрованием: GET и OPTIONS интеграций без него обходятся.
+'''
+import base64
+import hashlib
+import hmac
+import os
+from typing import Optional, Tuple
+
+from shared import config
+from shared.instrumentation import phase
+
+FORMAT_VERSION = 1
+NONCE_SIZE = 12
+WRAPPED_KEY_SIZE = 32 + 16
+
+_master: Optional[bytes] = None
+
+
+class VaultError(Exception):
+    pass
+
+
+def master_key() -> bytes:
+    '''SECRETS_MASTER_KEY — 32 байта в base64'''
+    global _master
+    if _master is None:
+        if not config.SECRETS_MASTER_KEY:
+            raise VaultError('SECRETS_MASTER_KEY is not configured')
+        key = base64.b64decode(config.SECRETS_MASTER_KEY)
+        if len(key) != 32:
+            raise VaultError('SECRETS_MASTER_KEY must be 32 bytes in base64')
+        _master = key
+    return _master
+
+
+def _associated_data(user_id: int) -> bytes:
+    return f'integrations.api_key:{user_id}'.encode('utf-8')
+
+
+def fingerprint(secret: str) -> str:
+    '''Ключевой отпечаток: сравнивать секреты можно, восстановить секрет по нему нельзя'''
+    return hmac.new(master_key(), secret.encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+
+def encrypt(secret: str, user_id: int) -> Tuple[bytes, str]:
+    '''(шифротекст для api_key_encrypted, отпечаток для api_key_fingerprint)'''
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    with phase('crypto'):
+        data_key = AESGCM.generate_key(bit_length=256)
+        key_nonce = os.urandom(NONCE_SIZE)
+        data_nonce = os.urandom(NONCE_SIZE)
+        associated = _associated_data(user_id)
+        wrapped = AESGCM(master_key()).encrypt(key_nonce, data_key, associated)
+        ciphertext = AESGCM(data_key).encrypt(data_nonce, secret.encode('utf-8'), associated)
+        blob = bytes([FORMAT_VERSION]) + key_nonce + wrapped + data_nonce + ciphertext
+        return blob, fingerprint(secret)
+
+
+def decrypt(blob: bytes, user_id: int) -> str:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    with phase('crypto'):
+        blob = bytes(blob)
+        if not blob or blob[0] != FORMAT_VERSION:
+            raise VaultError('Unknown secret format')
+        offset = 1
+        key_nonce = blob[offset:offset + NONCE_SIZE]
+        offset += NONCE_SIZE
+        wrapped = blob[offset:offset + WRAPPED_KEY_SIZE]
+        offset += WRAPPED_KEY_SIZE
+        data_nonce = blob[offset:offset + NONCE_SIZE]
+        offset += NONCE_SIZE
+        associated = _associated_data(user_id)
+        data_key = AESGCM(master_key()).decrypt(key_nonce, wrapped, associated)
+        return AESGCM(data_key).decrypt(data_nonce, blob[offset:], associated).decode('utf-8')
+
+
+def encrypt_optional(secret: Optional[str], user_id: int) -> Tuple[Optional[bytes], Optional[str]]:
+    if not secret:
+        return None, None
+    return encrypt(secret, user_id)
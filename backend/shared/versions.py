@@ -0,0 +1,11 @@
+'''Счётчики версий в cache_versions: общий признак устаревания кэшей во всех контейнерах'''
+from shared.queries import BUMP_VERSION, CURRENT_VERSION
+
+
+def current_version(cursor, name: str) -> int:
+    return CURRENT_VERSION.scalar(cursor, (name,)) or 0
+
+
+def bump_version(cursor, name: str) -> int:
+    '''Увеличивает версию в текущей транзакции, вместе с самой записью'''
+    return BUMP_VERSION.scalar(cursor, (name,))
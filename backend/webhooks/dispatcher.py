@@ -0,0 +1,275 @@
+'''Доставка событий из webhook_outbox: asyncio, пул соединений на хост, повторы с backoff, dead letter
+
+    python dispatcher.py            # один проход по очереди
+    python dispatcher.py --forever  # постоянный воркер; воркеров можно запускать несколько
+'''
+import argparse
+import asyncio
+import errno
+import hashlib
+import hmac
+import json
+import random
+import socket
+import time
+from typing import List, Optional, Tuple
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import DefaultResolver
+from psycopg2.extras import execute_values
+
+from shared import config
+from shared.db import get_pool
+from shared.outbox import is_public_address, webhook_url_error
+
+CLAIM_SQL = """
+    WITH claimed AS (
+        SELECT id
+        FROM webhook_outbox
+        WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+        ORDER BY next_attempt_at, id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE webhook_outbox o
+    SET attempts = o.attempts + 1,
+        next_attempt_at = CURRENT_TIMESTAMP + %s * interval '1 second'
+    FROM claimed, integrations i
+    WHERE o.id = claimed.id AND i.id = o.integration_id
+    RETURNING o.id, o.event_type, o.payload, o.attempts, o.created_at, i.webhook_url, i.settings
+"""
+
+
+PRUNE_SQL = """
+    DELETE FROM webhook_outbox
+    WHERE id IN (
+        SELECT id
+        FROM webhook_outbox
+        WHERE status = 'delivered' AND delivered_at < CURRENT_TIMESTAMP - %s * interval '1 day'
+        ORDER BY delivered_at
+        LIMIT %s
+    )
+"""
+
+
+class BlockedAddress(OSError):
+    '''Имя хоста вебхука разрешается только в непубличные адреса'''
+
+
+class PublicResolver(AbstractResolver):
+    '''Резолвер, который отбрасывает loopback, частные и link-local адреса
+
+    aiohttp соединяется только с адресами, которые вернул резолвер, поэтому проверка не
+    обходится подменой DNS между проверкой и соединением.
+    '''
+
+    def __init__(self):
+        self._resolver = DefaultResolver()
+
+    async def resolve(self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET) -> list:
+        addresses = await self._resolver.resolve(host, port, family)
+        public = [address for address in addresses if is_public_address(address['host'])]
+        if not public:
+            raise BlockedAddress(errno.EACCES, f'{host} resolves to a non-public address')
+        return public
+
+    async def close(self) -> None:
+        await self._resolver.close()
+
+
+class Delivery:
+    __slots__ = ('id', 'event_type', 'payload', 'attempts', 'created_at', 'url', 'secret')
+
+    def __init__(self, row: tuple):
+        self.id, self.event_type, self.payload, self.attempts, self.created_at, self.url, settings = row
+        self.secret = (settings or {}).get('webhookSecret')
+
+    def body(self) -> bytes:
+        return json.dumps({
+            'id': self.id,
+            'event': self.event_type,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+            'data': self.payload
+        }, ensure_ascii=False).encode('utf-8')
+
+
+class Dispatcher:
+    '''Забирает пачку через FOR UPDATE SKIP LOCKED с арендой и доставляет её вне транзакции'''
+
+    def __init__(self, batch_size: int = config.WEBHOOK_BATCH_SIZE,
+                 concurrency: int = config.WEBHOOK_CONCURRENCY,
+                 per_host: int = config.WEBHOOK_PER_HOST,
+                 timeout: float = config.WEBHOOK_TIMEOUT,
+                 max_attempts: int = config.WEBHOOK_MAX_ATTEMPTS,
+                 backoff_base: float = config.WEBHOOK_BACKOFF_BASE,
+                 backoff_max: float = config.WEBHOOK_BACKOFF_MAX,
+                 lease: float = config.WEBHOOK_LEASE):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease = lease
+
+    def backoff(self, attempts: int) -> float:
+        '''Экспоненциальная задержка с джиттером ±20%'''
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def session(self) -> aiohttp.ClientSession:
+        resolver = None if config.WEBHOOK_ALLOW_PRIVATE else PublicResolver()
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host, resolver=resolver)
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    def claim(self) -> List[Delivery]:
+        pool = get_pool()
+        conn = pool.acquire()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(CLAIM_SQL, (self.batch_size, self.lease))
+                rows = cursor.fetchall()
+            conn.commit()
+        finally:
+            pool.release(conn)
+        return [Delivery(row) for row in rows]
+
+    def prune(self, retention_days: float = config.WEBHOOK_RETENTION_DAYS,
+              batch: int = config.WEBHOOK_PRUNE_BATCH) -> int:
+        '''Удаляет доставленные события старше retention_days, не больше batch за вызов; dead остаются'''
+        pool = get_pool()
+        conn = pool.acquire()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(PRUNE_SQL, (retention_days, batch))
+                deleted = cursor.rowcount
+            conn.commit()
+        finally:
+            pool.release(conn)
+        return deleted
+
+    def settle(self, results: List[Tuple[Delivery, Optional[str], bool]]) -> dict:
+        '''Одним запросом отмечает доставленные, перенесённые и мёртвые события'''
+        stats = {'delivered': 0, 'retried': 0, 'dead': 0}
+        values = []
+        for delivery, failure, retryable in results:
+            if failure is None:
+                status, delay = 'delivered', 0.0
+            elif retryable and delivery.attempts < self.max_attempts:
+                status, delay = 'pending', self.backoff(delivery.attempts)
+            else:
+                status, delay = 'dead', 0.0
+            stats['retried' if status == 'pending' else status] += 1
+            values.append((delivery.id, status, delay, failure))
+
+        if not values:
+            return stats
+        pool = get_pool()
+        conn = pool.acquire()
+        try:
+            with conn.cursor() as cursor:
+                execute_values(cursor, """
+                    UPDATE webhook_outbox o
+                    SET status = v.status,
+                        next_attempt_at = CURRENT_TIMESTAMP + v.delay * interval '1 second',
+                        last_error = v.error,
+                        delivered_at = CASE WHEN v.status = 'delivered' THEN CURRENT_TIMESTAMP END
+                    FROM (VALUES %s) AS v(id, status, delay, error)
+                    WHERE o.id = v.id
+                """, values, template='(%s::bigint, %s, %s::float8, %s)', page_size=len(values))
+            conn.commit()
+        finally:
+            pool.release(conn)
+        return stats
+
+    async def deliver(self, session: aiohttp.ClientSession, delivery: Delivery) -> Tuple[Delivery, Optional[str], bool]:
+        '''(событие, текст ошибки или None, можно ли повторить)'''
+        if not delivery.url:
+            return delivery, 'Integration has no webhook_url', False
+        # Строки, записанные до проверки при сохранении, и адреса-литералы, которые aiohttp не резолвит
+        invalid = webhook_url_error(delivery.url)
+        if invalid:
+            return delivery, invalid, False
+
+        body = delivery.body()
+        headers = {
+            'Content-Type': 'application/json',
+            'X-Starry-Event': delivery.event_type,
+            'X-Starry-Delivery': str(delivery.id)
+        }
+        if delivery.secret:
+            signature = hmac.new(delivery.secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+            headers['X-Starry-Signature'] = f'sha256={signature}'
+
+        try:
+            # Без редиректов: Location мог бы увести запрос на внутренний адрес
+            async with session.post(delivery.url, data=body, headers=headers, allow_redirects=False) as reply:
+                if 200 <= reply.status < 300:
+                    return delivery, None, True
+                retryable = reply.status >= 500 or reply.status in (408, 425, 429)
+                return delivery, f'HTTP {reply.status}', retryable
+        except aiohttp.ClientConnectorError as e:
+            return delivery, f'{type(e).__name__}: {e}'[:500], not isinstance(e.os_error, BlockedAddress)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return delivery, f'{type(e).__name__}: {e}'[:500], True
+
+    async def run_once(self, session: aiohttp.ClientSession) -> dict:
+        loop = asyncio.get_running_loop()
+        deliveries = await loop.run_in_executor(None, self.claim)
+        if not deliveries:
+            return {'claimed': 0, 'delivered': 0, 'retried': 0, 'dead': 0}
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(delivery: Delivery):
+            async with semaphore:
+                return await self.deliver(session, delivery)
+
+        results = await asyncio.gather(*(bounded(delivery) for delivery in deliveries))
+        stats = await loop.run_in_executor(None, self.settle, results)
+        return {'claimed': len(deliveries), **stats}
+
+    async def drain(self, budget: float = config.WEBHOOK_DRAIN_SECONDS) -> dict:
+        '''Проходы по очереди, пока она не опустеет или не выйдет время'''
+        deadline = time.monotonic() + budget
+        total = {'claimed': 0, 'delivered': 0, 'retried': 0, 'dead': 0}
+        async with self.session() as session:
+            while time.monotonic() < deadline:
+                stats = await self.run_once(session)
+                for key, value in stats.items():
+                    total[key] += value
+                if stats['claimed'] < self.batch_size:
+                    break
+        total['pruned'] = await asyncio.get_running_loop().run_in_executor(None, self.prune)
+        return total
+
+    async def run_forever(self, idle_sleep: float = 1.0, prune_every: float = 300.0) -> None:
+        loop = asyncio.get_running_loop()
+        pruned_at = 0.0
+        async with self.session() as session:
+            while True:
+                stats = await self.run_once(session)
+                if stats['claimed'] == 0:
+                    if time.monotonic() - pruned_at >= prune_every:
+                        await loop.run_in_executor(None, self.prune)
+                        pruned_at = time.monotonic()
+                    await asyncio.sleep(idle_sleep)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--forever', action='store_true')
+    parser.add_argument('--idle-sleep', type=float, default=1.0)
+    args = parser.parse_args()
+
+    dispatcher = Dispatcher()
+    if args.forever:
+        asyncio.run(dispatcher.run_forever(args.idle_sleep))
+    else:
+        print(json.dumps(asyncio.run(dispatcher.drain())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+import asyncio
+
+from shared.http import error, response, scheduled
+
+
+def handler(event: dict, context) -> dict:
+    '''Доставка событий из webhook_outbox; вызывается по таймеру'''
+    if not scheduled(event):
+        return error(403, 'Access denied')
+
+    # aiohttp и драйвер БД подгружаются только для настоящего прохода, отказ их не импортирует
+    from dispatcher import Dispatcher
+
+    return response(200, asyncio.run(Dispatcher().drain()))
@@ -0,0 +1,48 @@
+'''Локальная заглушка получателя вебхуков для проверки dispatcher.py
+
+    python stub.py --port 8099 --fail-rate 0.3 --status 503
+'''
+import argparse
+import asyncio
+import random
+
+from aiohttp import web
+
+
+def make_app(fail_rate: float = 0.0, status: int = 503, delay: float = 0.0) -> web.Application:
+    received = []
+
+    async def receive(request: web.Request) -> web.Response:
+        if delay:
+            await asyncio.sleep(delay)
+        if random.random() < fail_rate:
+            return web.Response(status=status)
+        received.append({
+            'path': request.path,
+            'headers': dict(request.headers),
+            'body': await request.json()
+        })
+        return web.json_response({'ok': True})
+
+    async def log(request: web.Request) -> web.Response:
+        return web.json_response(received)
+
+    app = web.Application()
+    app['received'] = received
+    app.router.add_get('/_received', log)
+    app.router.add_post('/{tail:.*}', receive)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--status', type=int, default=503)
+    parser.add_argument('--delay', type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(make_app(args.fail_rate, args.status, args.delay), port=args.port)
+
+
+if __name__ == '__main__':
+    main()
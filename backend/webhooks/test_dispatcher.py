@@ -0,0 +1,249 @@
+'''Доставка вебхуков против локальной заглушки stub.py на свободном порту; claim и settle без БД
+
+    python -m pytest backend/webhooks/test_dispatcher.py
+'''
+import asyncio
+import hashlib
+import hmac
+import socket
+from datetime import datetime, timezone
+
+import pytest
+from aiohttp import web
+
+import dispatcher
+import stub
+from dispatcher import Delivery, Dispatcher, PublicResolver
+from shared import config
+
+CREATED_AT = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def delivery(url: str, attempts: int = 1, secret: str = None, delivery_id: int = 1) -> Delivery:
+    settings = {'webhookSecret': secret} if secret else {}
+    return Delivery((delivery_id, 'integration.created', {'id': 5}, attempts, CREATED_AT, url, settings))
+
+
+async def serve(app: web.Application):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}'
+
+
+async def deliver_to(app: web.Application):
+    runner, base = await serve(app)
+    try:
+        async with Dispatcher().session() as session:
+            return await Dispatcher().deliver(session, delivery(base + '/hook'))
+    finally:
+        await runner.cleanup()
+
+
+class FakeResolver:
+    '''Резолвер, который отдаёт заданные адреса для любого имени'''
+
+    addresses = ['127.0.0.1']
+
+    async def resolve(self, host: str, port: int = 0, family=socket.AF_INET) -> list:
+        return [
+            {'hostname': host, 'host': address, 'port': port, 'family': socket.AF_INET, 'proto': 0,
+             'flags': socket.AI_NUMERICHOST}
+            for address in self.addresses
+        ]
+
+    async def close(self) -> None:
+        pass
+
+
+class FakePool:
+    def acquire(self):
+        return self
+
+    def release(self, conn) -> None:
+        pass
+
+    def cursor(self):
+        return self
+
+    def commit(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+@pytest.fixture
+def private(monkeypatch) -> None:
+    '''Заглушка слушает 127.0.0.1, поэтому проверка адреса отключается, как при локальной разработке'''
+    monkeypatch.setattr(config, 'WEBHOOK_ALLOW_PRIVATE', True)
+
+
+@pytest.fixture
+def settled(monkeypatch) -> list:
+    '''Строки (id, status, delay, error), которые settle записал бы в webhook_outbox'''
+    rows = []
+    monkeypatch.setattr(dispatcher, 'get_pool', FakePool)
+    monkeypatch.setattr(dispatcher, 'execute_values', lambda cursor, sql, values, **kwargs: rows.extend(values))
+    return rows
+
+
+def test_delivered_body_and_signature(private):
+    app = stub.make_app()
+
+    async def run():
+        runner, base = await serve(app)
+        item = delivery(base + '/hook', secret='whsec')
+        try:
+            async with Dispatcher().session() as session:
+                return item, await Dispatcher().deliver(session, item)
+        finally:
+            await runner.cleanup()
+
+    item, result = asyncio.run(run())
+    assert result[1:] == (None, True)
+
+    received = app['received']
+    assert len(received) == 1
+    headers = received[0]['headers']
+    assert headers['X-Starry-Event'] == 'integration.created'
+    assert headers['X-Starry-Delivery'] == '1'
+    signature = hmac.new(b'whsec', item.body(), hashlib.sha256).hexdigest()
+    assert headers['X-Starry-Signature'] == f'sha256={signature}'
+    assert received[0]['body'] == {
+        'id': 1, 'event': 'integration.created', 'createdAt': CREATED_AT.isoformat(), 'data': {'id': 5}
+    }
+
+
+@pytest.mark.parametrize('status, retryable', [
+    (500, True), (503, True), (408, True), (425, True), (429, True),
+    (400, False), (401, False), (404, False), (410, False)
+])
+def test_status_classification(private, status, retryable):
+    _, failure, can_retry = asyncio.run(deliver_to(stub.make_app(fail_rate=1.0, status=status)))
+    assert failure == f'HTTP {status}'
+    assert can_retry is retryable
+
+
+def test_connection_refused_is_retryable(private):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    async def run():
+        async with Dispatcher().session() as session:
+            return await Dispatcher().deliver(session, delivery(f'http://127.0.0.1:{port}/hook'))
+
+    _, failure, retryable = asyncio.run(run())
+    assert failure and retryable
+
+
+def test_redirect_is_not_followed(private):
+    target = stub.make_app()
+
+    async def run():
+        target_runner, target_base = await serve(target)
+
+        async def redirect(request: web.Request) -> web.Response:
+            raise web.HTTPFound(target_base + '/hook')
+
+        app = web.Application()
+        app.router.add_post('/hook', redirect)
+        try:
+            return await deliver_to(app)
+        finally:
+            await target_runner.cleanup()
+
+    _, failure, retryable = asyncio.run(run())
+    assert failure == 'HTTP 302'
+    assert retryable is False
+    assert target['received'] == []
+
+
+def test_private_url_is_rejected_before_connecting():
+    _, failure, retryable = asyncio.run(Dispatcher().deliver(None, delivery('http://10.0.0.5/hook')))
+    assert failure == 'webhookUrl must not point to a private address'
+    assert retryable is False
+
+
+def test_public_resolver_drops_private_addresses(monkeypatch):
+    monkeypatch.setattr(dispatcher, 'DefaultResolver', FakeResolver)
+    monkeypatch.setattr(FakeResolver, 'addresses', ['10.0.0.5', '93.184.216.34', '169.254.169.254'])
+    resolved = asyncio.run(PublicResolver().resolve('hooks.example.com', 443))
+    assert [address['host'] for address in resolved] == ['93.184.216.34']
+
+
+def test_host_resolving_to_loopback_is_dead_lettered(monkeypatch):
+    '''Имя проходит проверку при сохранении, но резолвится в 127.0.0.1 — соединения нет, повтора тоже'''
+    monkeypatch.setattr(config, 'WEBHOOK_ALLOW_PRIVATE', False)
+    monkeypatch.setattr(dispatcher, 'DefaultResolver', FakeResolver)
+    app = stub.make_app()
+
+    async def run():
+        runner, base = await serve(app)
+        port = base.rsplit(':', 1)[1]
+        try:
+            async with Dispatcher().session() as session:
+                return await Dispatcher().deliver(session, delivery(f'http://hooks.example.com:{port}/hook'))
+        finally:
+            await runner.cleanup()
+
+    _, failure, retryable = asyncio.run(run())
+    assert 'non-public address' in failure
+    assert retryable is False
+    assert app['received'] == []
+
+
+def test_backoff_doubles_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(dispatcher.random, 'uniform', lambda low, high: 1.0)
+    worker = Dispatcher(backoff_base=5, backoff_max=60)
+    assert [worker.backoff(attempts) for attempts in range(1, 6)] == [5, 10, 20, 40, 60]
+
+
+def test_backoff_jitter_stays_within_twenty_percent():
+    worker = Dispatcher(backoff_base=10, backoff_max=3600)
+    for _ in range(100):
+        assert 8.0 <= worker.backoff(1) <= 12.0
+
+
+def test_settle_marks_delivered_retried_and_dead(settled, monkeypatch):
+    monkeypatch.setattr(dispatcher.random, 'uniform', lambda low, high: 1.0)
+    worker = Dispatcher(max_attempts=3, backoff_base=5, backoff_max=3600)
+    stats = worker.settle([
+        (delivery('', delivery_id=1), None, True),
+        (delivery('', attempts=2, delivery_id=2), 'HTTP 503', True),
+        (delivery('', attempts=3, delivery_id=3), 'HTTP 503', True),
+        (delivery('', delivery_id=4), 'HTTP 404', False)
+    ])
+
+    assert stats == {'delivered': 1, 'retried': 1, 'dead': 2}
+    assert settled == [
+        (1, 'delivered', 0.0, None),
+        (2, 'pending', 10.0, 'HTTP 503'),
+        (3, 'dead', 0.0, 'HTTP 503'),
+        (4, 'dead', 0.0, 'HTTP 404')
+    ]
+
+
+def test_run_once_delivers_claimed_batch(private, settled, monkeypatch):
+    app = stub.make_app()
+
+    async def run():
+        runner, base = await serve(app)
+        batch = [delivery(f'{base}/hook/{n}', delivery_id=n) for n in range(1, 6)]
+        monkeypatch.setattr(Dispatcher, 'claim', lambda self: batch)
+        try:
+            async with Dispatcher(concurrency=2).session() as session:
+                return await Dispatcher(concurrency=2).run_once(session)
+        finally:
+            await runner.cleanup()
+
+    stats = asyncio.run(run())
+    assert stats == {'claimed': 5, 'delivered': 5, 'retried': 0, 'dead': 0}
+    assert sorted(entry['path'] for entry in app['received']) == [f'/hook/{n}' for n in range(1, 6)]
+    assert [row[1] for row in settled] == ['delivered'] * 5
@@ -0,0 +1,59 @@
+'''Микробенчмарк bcrypt: сколько входов в секунду выдерживает процесс при разной стоимости
+
+    python benchmarks/bcrypt_cost.py --costs 10,11,12,13 --logins 64 --concurrency 8
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'auth'))
+
+from passwords import BCRYPT_WORKERS, check_password, hash_password
+
+
+def measure(cost: int, logins: int, concurrency: int) -> dict:
+    password = 'benchmark-password'
+    password_hash = hash_password(password, rounds=cost)
+
+    started = time.perf_counter()
+    check_password(password, password_hash)
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as requests:
+        results = list(requests.map(lambda _: check_password(password, password_hash), range(logins)))
+    elapsed = time.perf_counter() - started
+    assert all(results)
+
+    return {
+        'cost': cost,
+        'logins': logins,
+        'concurrency': concurrency,
+        'workers': BCRYPT_WORKERS,
+        'single_login_ms': round(single * 1000, 1),
+        'logins_per_sec': round(logins / elapsed, 2)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--costs', default='10,11,12,13')
+    parser.add_argument('--logins', type=int, default=32)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--json', action='store_true', help='вывести результат в JSON')
+    args = parser.parse_args()
+
+    results = [measure(int(cost), args.logins, args.concurrency) for cost in args.costs.split(',')]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'cost':>4} {'1 login, ms':>12} {'logins/sec':>11}  (workers={BCRYPT_WORKERS}, concurrency={args.concurrency})")
+    for row in results:
+        print(f"{row['cost']:>4} {row['single_login_ms']:>12} {row['logins_per_sec']:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''Сравнение двух отчётов benchmarks/run.py; код выхода 1, если p95 или время импорта при холодном
+старте выросли больше порога либо preflight начал загружать драйвер БД или криптографию
+
+    python benchmarks/compare.py benchmarks/results/abc1234.json benchmarks/results/def5678.json --threshold 10
+'''
+import argparse
+import json
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help='допустимый рост p95, %%')
+    parser.add_argument('--metric', default='p95', choices=('p50', 'p95', 'p99', 'mean'))
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding='utf-8') as f:
+        candidate = json.load(f)
+
+    print(f"{'scenario':<34} {baseline['commit']:>10} {candidate['commit']:>10}   change")
+    regressions = []
+    for name, stats in candidate['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        after_ms = stats['latency_ms'][args.metric]
+        if before is None:
+            print(f'{name:<34} {"-":>10} {after_ms:>10.3f}   new')
+            continue
+        before_ms = before['latency_ms'][args.metric]
+        change = (after_ms - before_ms) / before_ms * 100 if before_ms else 0.0
+        mark = ''
+        if change > args.threshold:
+            regressions.append(name)
+            mark = '  REGRESSION'
+        print(f'{name:<34} {before_ms:>10.3f} {after_ms:>10.3f} {change:>+8.1f}%{mark}')
+
+    for function, stats in candidate.get('cold_start', {}).items():
+        name = f'{function} cold start import'
+        before = baseline.get('cold_start', {}).get(function)
+        if before is None:
+            print(f"{name:<34} {'-':>10} {stats['import_ms']:>10.3f}   new")
+            continue
+        change = (stats['import_ms'] - before['import_ms']) / before['import_ms'] * 100 if before['import_ms'] else 0.0
+        mark = ''
+        heavy = sorted(set(stats['heavy']) - set(before['heavy']))
+        if change > args.threshold or heavy:
+            regressions.append(name)
+            mark = '  REGRESSION' + (f" (loads {', '.join(heavy)})" if heavy else '')
+        print(f"{name:<34} {before['import_ms']:>10.3f} {stats['import_ms']:>10.3f} {change:>+8.1f}%{mark}")
+
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
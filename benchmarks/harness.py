@@ -0,0 +1,88 @@
+'''Запуск handler() функций в текущем процессе; фазы БД, криптографии и сериализации берутся из Server-Timing'''
+import importlib
+import importlib.util
+import json
+import math
+import os
+import sys
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+FUNCTIONS = ('auth', 'modules', 'integrations', 'audit', 'dashboard')
+
+PHASES = ('db', 'crypto', 'serialize')
+
+SERVER_TIMING_PHASES = {'db': 'db', 'db_connect': 'db', 'crypto': 'crypto', 'serialize': 'serialize'}
+
+
+def phases_from_response(result: dict) -> dict:
+    '''Время фаз из заголовка Server-Timing, который ставит shared/instrumentation.py'''
+    spent = dict.fromkeys(PHASES, 0.0)
+    header = (result.get('headers') or {}).get('Server-Timing', '')
+    for metric in filter(None, (part.strip() for part in header.split(','))):
+        name, _, duration = metric.partition(';dur=')
+        if name in SERVER_TIMING_PHASES and duration:
+            spent[SERVER_TIMING_PHASES[name]] += float(duration) / 1000
+    return spent
+
+
+def load_handlers(dsn: str) -> Dict[str, Callable]:
+    '''Импортирует backend/*/index.py так же, как облачная среда'''
+    os.environ['DATABASE_URL'] = dsn
+    os.environ.setdefault('REQUEST_LOG', '0')
+    os.environ.setdefault('LOGIN_RATE_USER', '1000000')
+    sys.path.insert(0, os.path.join(BACKEND, 'auth'))
+
+    modules = {}
+    for name in FUNCTIONS:
+        spec = importlib.util.spec_from_file_location(f'{name}_index', os.path.join(BACKEND, name, 'index.py'))
+        modules[name] = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(modules[name])
+
+    return {name: module.handler for name, module in modules.items()}
+
+
+def reset_query_stats() -> None:
+    importlib.import_module('shared.queries').reset_stats()
+
+
+def query_stats() -> dict:
+    '''Вызовы и время по запросам shared/queries.py с последнего reset_query_stats()'''
+    return importlib.import_module('shared.queries').stats()
+
+
+def event(method: str = 'GET', body=None, headers: dict = None, query: dict = None) -> dict:
+    return {
+        'httpMethod': method,
+        'headers': headers or {},
+        'queryStringParameters': query or {},
+        'body': json.dumps(body) if body is not None else None
+    }
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], phases: List[dict], statuses: Dict[int, int], wall: float) -> dict:
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        'count': count,
+        'statuses': {str(status): n for status, n in sorted(statuses.items())},
+        'throughput_rps': round(count / wall, 2) if wall else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(ordered, 50) * 1000, 3),
+            'p95': round(percentile(ordered, 95) * 1000, 3),
+            'p99': round(percentile(ordered, 99) * 1000, 3),
+            'mean': round(sum(ordered) / count * 1000, 3) if count else 0.0
+        },
+        'phases_ms_mean': {
+            phase: round(sum(p[phase] for p in phases) / count * 1000, 3) if count else 0.0
+            for phase in PHASES
+        }
+    }
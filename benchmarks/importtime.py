@@ -0,0 +1,117 @@
+'''Холодный старт функций: что и за сколько импортируется до ответа на OPTIONS и на запрос без токена
+
+    python benchmarks/importtime.py --repeat 5
+    python benchmarks/importtime.py --output /tmp/cold.json --top 15
+
+Каждая функция запускается в отдельном интерпретаторе с -X importtime из своего каталога, как в
+облаке: import index, затем handler() на OPTIONS и на GET без X-Auth-Token. Время — медиана по
+--repeat запускам, по модулям — собственное время (self) из последнего запуска. Если для этих двух
+ответов загрузился драйвер БД или криптография (HEAVY_MODULES), код выхода 1.
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+import harness
+
+HEAVY_MODULES = ('psycopg2', 'jwt', 'bcrypt', 'cryptography')
+MARKER = '--cold-start--'
+
+PROBE = f'''
+import json, sys
+sys.stderr.write({MARKER!r} + '\\n')
+import index
+statuses = [
+    index.handler({{'httpMethod': 'OPTIONS', 'headers': {{}}}}, None)['statusCode'],
+    index.handler({{'httpMethod': 'GET', 'headers': {{}}}}, None)['statusCode'],
+]
+loaded = sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules)
+print(json.dumps({{'statuses': statuses, 'heavy': loaded}}))
+'''
+
+
+def parse_importtime(stderr: str) -> List[dict]:
+    '''Строки "import time: self | cumulative | name" после маркера, в микросекундах'''
+    _, _, tail = stderr.partition(MARKER)
+    rows = []
+    for line in tail.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        rows.append({
+            'module': name.strip(),
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us)
+        })
+    return rows
+
+
+def probe(function: str) -> dict:
+    env = {**os.environ, 'REQUEST_LOG': '0', 'PYTHONDONTWRITEBYTECODE': '1'}
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=os.path.join(harness.BACKEND, function), env=env, capture_output=True, text=True, check=False
+    )
+    if completed.returncode != 0:
+        raise SystemExit(f'{function}: probe failed\n{completed.stderr[-2000:]}')
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['imports'] = parse_importtime(completed.stderr)
+    return result
+
+
+def measure(functions=harness.FUNCTIONS, repeat: int = 5, top: int = 10) -> Dict[str, dict]:
+    '''Отчёт по функциям для benchmarks/run.py и compare.py'''
+    report = {}
+    for function in functions:
+        runs = [probe(function) for _ in range(repeat)]
+        last = runs[-1]
+        totals = [sum(row['self_us'] for row in run['imports']) / 1000 for run in runs]
+        slowest = sorted(last['imports'], key=lambda row: row['self_us'], reverse=True)[:top]
+        report[function] = {
+            'import_ms': round(statistics.median(totals), 3),
+            'modules': len(last['imports']),
+            'heavy': last['heavy'],
+            'statuses': last['statuses'],
+            'slowest': [
+                {'module': row['module'], 'self_ms': round(row['self_us'] / 1000, 3),
+                 'cumulative_ms': round(row['cumulative_us'] / 1000, 3)}
+                for row in slowest
+            ]
+        }
+    return report
+
+
+def print_report(report: Dict[str, dict]) -> None:
+    for function, stats in report.items():
+        heavy = ', '.join(stats['heavy']) or '-'
+        print(f"{function:<14} import {stats['import_ms']:>8.2f} ms  {stats['modules']:>4} modules  "
+              f"statuses {stats['statuses']}  heavy: {heavy}")
+        for row in stats['slowest']:
+            print(f"    {row['module']:<40} self {row['self_ms']:>7.2f} ms  cumulative {row['cumulative_ms']:>7.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--functions', help='через запятую; по умолчанию как в benchmarks/run.py')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='сколько самых дорогих модулей показать')
+    parser.add_argument('--output', help='сохранить отчёт в JSON')
+    args = parser.parse_args()
+
+    functions = args.functions.split(',') if args.functions else harness.FUNCTIONS
+    report = measure(functions, args.repeat, args.top)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if any(stats['heavy'] for stats in report.values()):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+'''Нагрузочный прогон handler() в процессе против локальной БД, наполненной benchmarks/seed.py
+
+    python benchmarks/run.py --dsn postgresql://localhost/starry_bench --iterations 200
+    python benchmarks/compare.py benchmarks/results/<old>.json benchmarks/results/<new>.json
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import harness
+import importtime
+from seed import BENCH_PASSWORD, bench_email
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def scenarios(token: str, iteration_counter) -> dict:
+    '''Имя сценария -> фабрика события; события пишущих сценариев меняются от итерации'''
+    auth = {'X-Auth-Token': token}
+    bulk_items = [
+        {'service': f'bench-bulk-{n}', 'settings': {'n': n}, 'webhookUrl': f'https://hooks.bench.local/bulk/{n}'}
+        for n in range(30)
+    ]
+    return {
+        'auth POST login': ('auth', lambda: harness.event(
+            'POST', {'action': 'login', 'email': bench_email(1), 'password': BENCH_PASSWORD})),
+        'auth GET user': ('auth', lambda: harness.event('GET', headers=auth)),
+        'auth OPTIONS': ('auth', lambda: harness.event('OPTIONS')),
+        'modules GET list': ('modules', lambda: harness.event('GET', headers=auth)),
+        'modules POST create': ('modules', lambda: harness.event('POST', {
+            'name': f'Bench module {next(iteration_counter)}', 'icon': 'Box', 'allowedRoles': ['user']
+        }, headers=auth)),
+        'integrations GET list': ('integrations', lambda: harness.event('GET', headers=auth)),
+        'integrations GET list limit=500': ('integrations', lambda: harness.event(
+            'GET', headers=auth, query={'limit': '500'})),
+        'integrations GET service': ('integrations', lambda: harness.event(
+            'GET', headers=auth, query={'service': 'telegram-8'})),
+        'integrations GET settings filter': ('integrations', lambda: harness.event(
+            'GET', headers=auth, query={'settings': '{"batch": 3}', 'isActive': 'true'})),
+        'integrations GET service prefix': ('integrations', lambda: harness.event(
+            'GET', headers=auth, query={'servicePrefix': 'telegram-1'})),
+        'integrations POST bulk': ('integrations', lambda: harness.event(
+            'POST', {'action': 'bulk', 'items': bulk_items}, headers=auth)),
+        'integrations PUT toggle': ('integrations', lambda: harness.event(
+            'PUT', {'action': 'toggle', 'isActive': next(iteration_counter) % 2 == 0,
+                    'services': [item['service'] for item in bulk_items]}, headers=auth)),
+        'dashboard GET summary': ('dashboard', lambda: harness.event('GET', headers=auth)),
+    }
+
+
+def run_scenario(handler, make_event, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        handler(make_event(), None)
+    harness.reset_query_stats()
+
+    latencies, phases, statuses = [], [], Counter()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        event = make_event()
+        call_started = time.perf_counter()
+        result = handler(event, None)
+        latencies.append(time.perf_counter() - call_started)
+        phases.append(harness.phases_from_response(result))
+        statuses[result['statusCode']] += 1
+    summary = harness.summarize(latencies, phases, statuses, time.perf_counter() - started)
+    summary['queries'] = harness.query_stats()
+    return summary
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=harness.ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--login-iterations', type=int, default=20, help='вход дорог из-за bcrypt')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--only', help='подстрока имени сценария')
+    parser.add_argument('--cold-start-repeat', type=int, default=5,
+                        help='запусков benchmarks/importtime.py на функцию; 0 — не измерять холодный старт')
+    parser.add_argument('--output', help='путь к JSON; по умолчанию benchmarks/results/<commit>.json')
+    args = parser.parse_args()
+
+    handlers = harness.load_handlers(args.dsn)
+    login = handlers['auth'](harness.event(
+        'POST', {'action': 'login', 'email': bench_email(1), 'password': BENCH_PASSWORD}), None)
+    if login['statusCode'] != 200:
+        raise SystemExit(f'bench login failed, run benchmarks/seed.py first: {login["body"]}')
+    token = json.loads(login['body'])['token']
+
+    counter = iter(range(10 ** 9))
+    results = {}
+    for name, (function, make_event) in scenarios(token, counter).items():
+        if args.only and args.only not in name:
+            continue
+        iterations = args.login_iterations if 'login' in name else args.iterations
+        results[name] = run_scenario(handlers[function], make_event, iterations, args.warmup)
+        stats = results[name]
+        print(f"{name:<34} p50 {stats['latency_ms']['p50']:>9.3f}  p95 {stats['latency_ms']['p95']:>9.3f}  "
+              f"p99 {stats['latency_ms']['p99']:>9.3f} ms  {stats['throughput_rps']:>9.1f} rps  "
+              f"db {stats['phases_ms_mean']['db']:.3f} / crypto {stats['phases_ms_mean']['crypto']:.3f} / "
+              f"serialize {stats['phases_ms_mean']['serialize']:.3f} ms")
+
+    cold_start = {}
+    if args.cold_start_repeat:
+        cold_start = importtime.measure(repeat=args.cold_start_repeat, top=5)
+        importtime.print_report(cold_start)
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'iterations': args.iterations,
+        'scenarios': results,
+        'cold_start': cold_start
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'saved {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+'''Наполнение локальной БД для бенчмарков реалистичными объёмами
+
+    python benchmarks/seed.py --dsn postgresql://localhost/starry_bench --migrate --reset
+'''
+import argparse
+import os
+import sys
+import time
+
+import bcrypt
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+import migrate as migrations  # noqa: E402
+
+BENCH_PASSWORD = 'bench-password'
+SERVICES = ('telegram', 'slack', 'amocrm', 'bitrix24', 'yookassa', 'google-sheets', 'mailchimp', 'webhook')
+
+
+def bench_email(n: int) -> str:
+    return f'bench{n}@bench.local'
+
+
+def seed(cursor, users: int, modules: int, integrations: int, hot_tenant: int, rounds: int) -> None:
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+    cursor.execute("""
+        INSERT INTO users (email, password_hash, role)
+        SELECT 'bench' || g || '@bench.local', %s,
+               (ARRAY['owner', 'admin', 'manager', 'accountant', 'user'])[1 + (g - 1) %% 5]
+        FROM generate_series(1, %s) g
+        ON CONFLICT (email) DO NOTHING
+    """, (password_hash, users))
+
+    cursor.execute("""
+        CREATE TEMP TABLE bench_users ON COMMIT DROP AS
+        SELECT id, role, row_number() OVER (ORDER BY id) AS rn
+        FROM users WHERE email LIKE 'bench%%@bench.local'
+    """)
+    cursor.execute("""
+        CREATE TEMP TABLE bench_owners ON COMMIT DROP AS
+        SELECT id, row_number() OVER (ORDER BY id) AS rn
+        FROM bench_users WHERE role = 'owner'
+    """)
+
+    cursor.execute("""
+        INSERT INTO modules (name, icon, is_premium, is_active, allowed_roles, owner_id, created_at, updated_at)
+        SELECT 'Module ' || g,
+               'Box',
+               g %% 4 = 0,
+               g %% 10 <> 0,
+               CASE g %% 4
+                   WHEN 0 THEN ARRAY['admin', 'manager']
+                   WHEN 1 THEN ARRAY['user']
+                   WHEN 2 THEN ARRAY['accountant', 'user']
+                   ELSE ARRAY['admin']
+               END,
+               o.id,
+               now() - g * interval '1 minute',
+               now() - g * interval '1 minute'
+        FROM generate_series(1, %s) g
+        JOIN bench_owners o ON o.rn = 1 + g %% (SELECT count(*) FROM bench_owners)
+    """, (modules,))
+
+    cursor.execute("""
+        INSERT INTO integrations (user_id, service_name, api_key, webhook_url, settings, is_active, created_at, updated_at)
+        SELECT u.id,
+               (%s::text[])[1 + g %% %s] || '-' || g,
+               CASE WHEN g %% 3 = 0 THEN NULL ELSE md5(g::text) END,
+               'https://hooks.bench.local/' || g,
+               jsonb_build_object('region', (ARRAY['ru', 'kz', 'by'])[1 + g %% 3], 'batch', g %% 50),
+               g %% 7 <> 0,
+               now() - g * interval '1 second',
+               now() - g * interval '1 second'
+        FROM generate_series(1, %s) g
+        JOIN bench_users u ON u.rn = CASE WHEN g <= %s THEN 1 ELSE 1 + g %% (SELECT count(*) FROM bench_users) END
+        ON CONFLICT (user_id, service_name) DO NOTHING
+    """, (list(SERVICES), len(SERVICES), integrations, hot_tenant))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--modules', type=int, default=10_000)
+    parser.add_argument('--integrations', type=int, default=50_000)
+    parser.add_argument('--hot-tenant', type=int, default=2_000, help='сколько интеграций отдать bench1@bench.local')
+    parser.add_argument('--rounds', type=int, default=int(os.environ.get('BCRYPT_ROUNDS', '12')))
+    parser.add_argument('--migrate', action='store_true', help='применить db_migrations/*.sql через scripts/migrate.py')
+    parser.add_argument('--reset', action='store_true', help='очистить таблицы перед наполнением')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.migrate:
+        conn = migrations.connect(args.dsn)
+        try:
+            migrations.migrate(conn)
+        finally:
+            conn.close()
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        with conn.cursor() as cursor:
+            if args.reset:
+                cursor.execute("TRUNCATE integrations, user_modules, modules, users RESTART IDENTITY CASCADE")
+            seed(cursor, args.users, args.modules, args.integrations, args.hot_tenant, args.rounds)
+        conn.commit()
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE")
+    finally:
+        conn.close()
+    print(f'seeded in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(100) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO cache_versions (name) VALUES ('modules')
+ON CONFLICT (name) DO NOTHING;
+
+-- Файл с CONCURRENTLY раннер выполняет по одной команде вне транзакции, поэтому все команды идемпотентны
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_modules_allowed_roles ON modules USING GIN (allowed_roles);
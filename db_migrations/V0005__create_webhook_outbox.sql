@@ -0,0 +1,17 @@
+CREATE TABLE IF NOT EXISTS webhook_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    integration_id INTEGER NOT NULL REFERENCES integrations(id) ON DELETE CASCADE,
+    event_type VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'delivered', 'dead')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    delivered_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_pending ON webhook_outbox(next_attempt_at, id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_dead ON webhook_outbox(integration_id) WHERE status = 'dead';
+-- Для очистки доставленных событий старше WEBHOOK_RETENTION_DAYS
+CREATE INDEX IF NOT EXISTS idx_webhook_outbox_delivered ON webhook_outbox(delivered_at) WHERE status = 'delivered';
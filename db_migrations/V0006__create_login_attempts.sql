@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS login_attempts (
+    key VARCHAR(320) PRIMARY KEY,
+    window_start TIMESTAMPTZ NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_login_attempts_window ON login_attempts(window_start);
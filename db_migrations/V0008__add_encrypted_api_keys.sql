@@ -0,0 +1,4 @@
+ALTER TABLE integrations ADD COLUMN IF NOT EXISTS api_key_encrypted BYTEA;
+ALTER TABLE integrations ADD COLUMN IF NOT EXISTS api_key_fingerprint VARCHAR(16);
+
+CREATE INDEX IF NOT EXISTS idx_integrations_plaintext_key ON integrations(id) WHERE api_key IS NOT NULL;
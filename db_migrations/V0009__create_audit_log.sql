@@ -0,0 +1,64 @@
+CREATE TABLE IF NOT EXISTS audit_log (
+    id BIGSERIAL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    user_id INTEGER,
+    role VARCHAR(50),
+    action VARCHAR(100) NOT NULL,
+    entity_type VARCHAR(50) NOT NULL,
+    entity_id BIGINT,
+    changes JSONB NOT NULL DEFAULT '{}',
+    request_id VARCHAR(64),
+    ip INET,
+    PRIMARY KEY (created_at, id),
+    -- Секреты попадают в журнал только как <поле>Changed (SECRET_FIELDS и SECRET_SETTINGS в shared/audit.py)
+    CONSTRAINT audit_log_no_secrets CHECK (
+        NOT changes ?| ARRAY['apiKey', 'webhookUrl', 'webhookSecret']
+        AND NOT COALESCE(changes -> 'settings' ?| ARRAY['apiKey', 'webhookSecret'], false)
+    )
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS audit_log_default PARTITION OF audit_log DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_audit_log_user ON audit_log(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_log_entity ON audit_log(entity_type, entity_id, created_at DESC, id DESC);
+
+-- Месячные секции от текущего месяца на months_ahead вперёд; старые удаляются DROP TABLE audit_log_YYYY_MM.
+-- Месяц, строки которого уже попали в audit_log_default, пропускается: секцию под них создать нельзя.
+CREATE OR REPLACE FUNCTION ensure_audit_partitions(months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    first_month TIMESTAMPTZ := date_trunc('month', now());
+    range_start TIMESTAMPTZ;
+    range_end TIMESTAMPTZ;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        range_start := first_month + make_interval(months => i);
+        range_end := range_start + interval '1 month';
+        partition_name := 'audit_log_' || to_char(range_start, 'YYYY_MM');
+        CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+        IF EXISTS (SELECT 1 FROM audit_log_default WHERE created_at >= range_start AND created_at < range_end) THEN
+            RAISE NOTICE 'audit_log_default has rows for %, partition % skipped', range_start, partition_name;
+            CONTINUE;
+        END IF;
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF audit_log FOR VALUES FROM (%L) TO (%L)',
+            partition_name, range_start, range_end
+        );
+        created := created + 1;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION audit_log_append_only() RETURNS TRIGGER AS $$
+BEGIN
+    RAISE EXCEPTION 'audit_log is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS audit_log_append_only ON audit_log;
+CREATE TRIGGER audit_log_append_only BEFORE UPDATE OR DELETE ON audit_log
+    FOR EACH ROW EXECUTE FUNCTION audit_log_append_only();
+
+SELECT ensure_audit_partitions(12);
@@ -0,0 +1,191 @@
+-- Счётчики для сводки: поддерживаются триггерами уровня оператора, читаются одним запросом
+-- за O(1) строк независимо от числа модулей и интеграций.
+
+-- Модуль виден пользователю, если его роль есть в allowed_roles (строка с owner_id = 0)
+-- или если пользователь — владелец, а его роли в allowed_roles нет (строка с owner_id владельца).
+CREATE TABLE IF NOT EXISTS module_counts (
+    role VARCHAR(50) NOT NULL,
+    owner_id INTEGER NOT NULL DEFAULT 0,
+    is_active BOOLEAN NOT NULL,
+    is_premium BOOLEAN NOT NULL,
+    modules INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (role, owner_id, is_active, is_premium)
+);
+
+CREATE TABLE IF NOT EXISTS integration_totals (
+    user_id INTEGER PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0,
+    active INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS integration_counts (
+    user_id INTEGER NOT NULL,
+    service_name VARCHAR(100) NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    active INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, service_name)
+);
+
+-- Вклад набора строк modules в module_counts со знаком sign
+CREATE OR REPLACE FUNCTION module_count_rows(changed modules[], sign INTEGER)
+RETURNS TABLE (role VARCHAR, owner_id INTEGER, is_active BOOLEAN, is_premium BOOLEAN, delta INTEGER) AS $$
+    SELECT r.role, 0, COALESCE(m.is_active, false), COALESCE(m.is_premium, false), sign
+    FROM unnest(changed) m
+    -- allowedRoles приходит от клиента как есть: ['user', 'user'] — один модуль, как и в списке модулей
+    CROSS JOIN LATERAL (SELECT DISTINCT unnest(m.allowed_roles)) AS r(role)
+    UNION ALL
+    SELECT r.role, m.owner_id, COALESCE(m.is_active, false), COALESCE(m.is_premium, false), sign
+    FROM unnest(changed) m
+    -- те же роли, что в CHECK таблицы users
+    CROSS JOIN unnest(ARRAY['owner', 'admin', 'manager', 'accountant', 'user']) AS r(role)
+    WHERE m.owner_id IS NOT NULL AND NOT m.allowed_roles @> ARRAY[r.role]::text[]
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION module_counts_refresh() RETURNS TRIGGER AS $$
+DECLARE
+    added modules[] := '{}';
+    removed modules[] := '{}';
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT COALESCE(array_agg(n), '{}') INTO added FROM new_rows n;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT COALESCE(array_agg(o), '{}') INTO removed FROM old_rows o;
+    ELSE
+        -- Правка имени или иконки счётчики не меняет
+        SELECT COALESCE(array_agg(n), '{}'), COALESCE(array_agg(o), '{}') INTO added, removed
+        FROM new_rows n JOIN old_rows o ON o.id = n.id
+        WHERE (n.is_active, n.is_premium, n.allowed_roles, n.owner_id)
+              IS DISTINCT FROM (o.is_active, o.is_premium, o.allowed_roles, o.owner_id);
+    END IF;
+    IF cardinality(added) + cardinality(removed) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO module_counts AS c (role, owner_id, is_active, is_premium, modules)
+    SELECT d.role, d.owner_id, d.is_active, d.is_premium, sum(d.delta)
+    FROM (
+        SELECT * FROM module_count_rows(added, 1)
+        UNION ALL
+        SELECT * FROM module_count_rows(removed, -1)
+    ) d
+    GROUP BY d.role, d.owner_id, d.is_active, d.is_premium
+    HAVING sum(d.delta) <> 0
+    -- Строки (роль, 0, ...) общие для всех записей модулей: единый порядок блокировок вместо порядка хэш-агрегата,
+    -- иначе две параллельные записи захватывают их навстречу друг другу и получают deadlock
+    ORDER BY d.role, d.owner_id, d.is_active, d.is_premium
+    ON CONFLICT (role, owner_id, is_active, is_premium) DO UPDATE SET modules = c.modules + EXCLUDED.modules;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Вклад набора строк integrations в integration_counts и integration_totals со знаком sign
+CREATE OR REPLACE FUNCTION integration_count_rows(changed integrations[], sign INTEGER)
+RETURNS TABLE (user_id INTEGER, service_name VARCHAR, total INTEGER, active INTEGER) AS $$
+    SELECT i.user_id, i.service_name, sign, CASE WHEN i.is_active THEN sign ELSE 0 END
+    FROM unnest(changed) i
+    WHERE i.user_id IS NOT NULL
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION integration_counts_refresh() RETURNS TRIGGER AS $$
+DECLARE
+    added integrations[] := '{}';
+    removed integrations[] := '{}';
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT COALESCE(array_agg(n), '{}') INTO added FROM new_rows n;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT COALESCE(array_agg(o), '{}') INTO removed FROM old_rows o;
+    ELSE
+        -- Правка настроек, ключа или вебхука счётчики не меняет
+        SELECT COALESCE(array_agg(n), '{}'), COALESCE(array_agg(o), '{}') INTO added, removed
+        FROM new_rows n JOIN old_rows o ON o.id = n.id
+        WHERE (n.is_active, n.user_id, n.service_name) IS DISTINCT FROM (o.is_active, o.user_id, o.service_name);
+    END IF;
+    IF cardinality(added) + cardinality(removed) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    WITH d AS MATERIALIZED (
+        SELECT * FROM integration_count_rows(added, 1)
+        UNION ALL
+        SELECT * FROM integration_count_rows(removed, -1)
+    ), per_service AS (
+        INSERT INTO integration_counts AS c (user_id, service_name, total, active)
+        SELECT d.user_id, d.service_name, sum(d.total), sum(d.active)
+        FROM d
+        GROUP BY d.user_id, d.service_name
+        HAVING sum(d.total) <> 0 OR sum(d.active) <> 0
+        ORDER BY d.user_id, d.service_name
+        ON CONFLICT (user_id, service_name) DO UPDATE
+        SET total = c.total + EXCLUDED.total, active = c.active + EXCLUDED.active
+    )
+    INSERT INTO integration_totals AS t (user_id, total, active)
+    SELECT d.user_id, sum(d.total), sum(d.active)
+    FROM d
+    GROUP BY d.user_id
+    HAVING sum(d.total) <> 0 OR sum(d.active) <> 0
+    ORDER BY d.user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET total = t.total + EXCLUDED.total, active = t.active + EXCLUDED.active;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION dashboard_counts_truncate() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'modules' THEN
+        TRUNCATE module_counts;
+    ELSE
+        TRUNCATE integration_counts, integration_totals;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Пока строим счётчики с нуля, запись в исходные таблицы ждёт (не дольше lock_timeout раннера)
+LOCK TABLE modules, integrations IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS module_counts_insert ON modules;
+DROP TRIGGER IF EXISTS module_counts_update ON modules;
+DROP TRIGGER IF EXISTS module_counts_delete ON modules;
+DROP TRIGGER IF EXISTS module_counts_truncate ON modules;
+CREATE TRIGGER module_counts_insert AFTER INSERT ON modules
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION module_counts_refresh();
+CREATE TRIGGER module_counts_update AFTER UPDATE ON modules
+    REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION module_counts_refresh();
+CREATE TRIGGER module_counts_delete AFTER DELETE ON modules
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION module_counts_refresh();
+CREATE TRIGGER module_counts_truncate AFTER TRUNCATE ON modules
+    FOR EACH STATEMENT EXECUTE FUNCTION dashboard_counts_truncate();
+
+DROP TRIGGER IF EXISTS integration_counts_insert ON integrations;
+DROP TRIGGER IF EXISTS integration_counts_update ON integrations;
+DROP TRIGGER IF EXISTS integration_counts_delete ON integrations;
+DROP TRIGGER IF EXISTS integration_counts_truncate ON integrations;
+CREATE TRIGGER integration_counts_insert AFTER INSERT ON integrations
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION integration_counts_refresh();
+CREATE TRIGGER integration_counts_update AFTER UPDATE ON integrations
+    REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION integration_counts_refresh();
+CREATE TRIGGER integration_counts_delete AFTER DELETE ON integrations
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION integration_counts_refresh();
+CREATE TRIGGER integration_counts_truncate AFTER TRUNCATE ON integrations
+    FOR EACH STATEMENT EXECUTE FUNCTION dashboard_counts_truncate();
+
+TRUNCATE module_counts, integration_counts, integration_totals;
+
+INSERT INTO module_counts (role, owner_id, is_active, is_premium, modules)
+SELECT role, owner_id, is_active, is_premium, sum(delta)
+FROM module_count_rows(ARRAY(SELECT m FROM modules m), 1)
+GROUP BY role, owner_id, is_active, is_premium;
+
+INSERT INTO integration_counts (user_id, service_name, total, active)
+SELECT user_id, service_name, count(*), count(*) FILTER (WHERE is_active)
+FROM integrations
+WHERE user_id IS NOT NULL
+GROUP BY user_id, service_name;
+
+INSERT INTO integration_totals (user_id, total, active)
+SELECT user_id, count(*), count(*) FILTER (WHERE is_active)
+FROM integrations
+WHERE user_id IS NOT NULL
+GROUP BY user_id;
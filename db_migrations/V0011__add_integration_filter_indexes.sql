@@ -0,0 +1,8 @@
+-- Фильтр GET интеграций settings @> ...: jsonb_path_ops поддерживает только @>,
+-- зато индекс меньше и быстрее стандартного jsonb_ops.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_integrations_settings ON integrations USING GIN (settings jsonb_path_ops);
+
+-- Фильтр servicePrefix (service_name LIKE 'tele%'): btree UNIQUE (user_id, service_name) даёт диапазон
+-- для LIKE только при сортировке C, а varchar_pattern_ops сравнивает побайтно при любой сортировке базы.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_integrations_user_service_prefix
+    ON integrations(user_id, service_name varchar_pattern_ops);
@@ -0,0 +1,37 @@
+'''Шифрует открытые integrations.api_key, оставшиеся до V0008; нужен SECRETS_MASTER_KEY'''
+from typing import Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from shared import vault
+
+AFTER = 'V0008'
+
+
+def remaining(cursor) -> int:
+    cursor.execute("SELECT count(*) FROM integrations WHERE api_key IS NOT NULL")
+    return cursor.fetchone()[0]
+
+
+def batch(cursor, position: Optional[str], size: int) -> Tuple[int, Optional[str]]:
+    '''Следующие size строк после id = position; строки, записанные старым кодом позже, подберёт повторный запуск'''
+    cursor.execute("""
+        SELECT id, user_id, api_key
+        FROM integrations
+        WHERE api_key IS NOT NULL AND id > %s
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE
+    """, (int(position or 0), size))
+    rows = cursor.fetchall()
+    if not rows:
+        return 0, position
+
+    values = [(row_id, *vault.encrypt(api_key, user_id)) for row_id, user_id, api_key in rows]
+    execute_values(cursor, """
+        UPDATE integrations i
+        SET api_key_encrypted = v.encrypted, api_key_fingerprint = v.fingerprint, api_key = NULL
+        FROM (VALUES %s) AS v(id, encrypted, fingerprint)
+        WHERE i.id = v.id
+    """, values, template='(%s, %s::bytea, %s)', page_size=len(values))
+    return len(rows), str(rows[-1][0])
@@ -0,0 +1,327 @@
+'''Локальный шлюз: все backend/*/index.py в одном процессе на одном порту, с перезагрузкой при правке файлов
+
+    python scripts/devserver.py --dsn postgresql://localhost/starry --port 8000
+    curl -X POST localhost:8000/auth -d '{"action": "login", "email": "...", "password": "..."}'
+
+Функция отвечает на /<имя> (и /<имя>/..., путь в event['path']). HTTP-запрос превращается в event
+облачной функции, handler() выполняется в пуле потоков, так что запросы к разным функциям и к одной
+функции идут параллельно. Модули живут между запросами, как в тёплом контейнере: пул соединений,
+подготовленные запросы и кэши прогреваются и видны в GET /_dev/stats.
+
+Отличие от облака: shared/ импортируется один раз на процесс, поэтому пул и кэши из shared общие
+для всех функций, а не свои в каждом контейнере. Локальные модули функций (passwords.py, dispatcher.py)
+должны называться по-разному — все каталоги функций лежат в sys.path.
+
+Правка файла функции перезагружает только её; правка shared/ перезагружает shared и все функции
+(пул закрывается, кэши сбрасываются). Если новая версия не импортируется, работает прежняя.
+
+С --timers фоновые функции из TIMERS вызываются событием таймер-триггера с тем же интервалом,
+что и в облаке, — без X-Cron-Secret и без внешнего cron.
+'''
+import argparse
+import asyncio
+import base64
+import glob
+import importlib.util
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+SHARED = os.path.join(BACKEND, 'shared')
+
+# Таймер-триггеры облака: функция -> интервал, сек (cron в README, раздел «Таймеры»)
+TIMERS = {'webhooks': 60, 'maintenance': 3600}
+TIMER_EVENT_TYPE = 'yandex.cloud.events.serverless.triggers.TimerMessage'
+
+
+class Context:
+    '''То немногое из context облачной функции, что читают обработчики'''
+
+    __slots__ = ('request_id', 'function_name')
+
+    def __init__(self, request_id: str, function_name: str):
+        self.request_id = request_id
+        self.function_name = function_name
+
+
+def source_mtimes(directory: str) -> Dict[str, float]:
+    '''*.py каталога без вложенных (shared у функции — симлинк и отслеживается отдельно)'''
+    mtimes = {}
+    for path in glob.glob(os.path.join(directory, '*.py')):
+        try:
+            mtimes[path] = os.stat(path).st_mtime
+        except FileNotFoundError:
+            pass
+    return mtimes
+
+
+class Function:
+    '''Одна функция backend/<name>: текущий handler и модули, импортированные из её каталога'''
+
+    def __init__(self, name: str):
+        self.name = name
+        self.directory = os.path.join(BACKEND, name)
+        self.module = None
+        self.handler: Optional[Callable] = None
+        self.load_error: Optional[str] = None
+        self.loaded_at = 0.0
+        self.mtimes = {}
+        self._local = set()
+
+    def load(self) -> bool:
+        '''Импортирует index.py заново; при ошибке остаётся прежний handler'''
+        self.mtimes = source_mtimes(self.directory)
+        for name in self._local:
+            sys.modules.pop(name, None)
+        before = set(sys.modules)
+        try:
+            spec = importlib.util.spec_from_file_location(
+                f'{self.name}_index', os.path.join(self.directory, 'index.py')
+            )
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        except Exception:
+            self.load_error = traceback.format_exc()
+            print(f'[devserver] {self.name}: load failed\n{self.load_error}', file=sys.stderr, flush=True)
+            return False
+        finally:
+            self._local |= {name for name in set(sys.modules) - before if self._owns(sys.modules[name])}
+
+        self.module, self.handler = module, module.handler
+        self.load_error = None
+        self.loaded_at = time.time()
+        return True
+
+    def changed(self) -> bool:
+        return source_mtimes(self.directory) != self.mtimes
+
+    def _owns(self, module) -> bool:
+        path = getattr(module, '__file__', None)
+        return bool(path) and os.path.dirname(os.path.realpath(path)) == os.path.realpath(self.directory)
+
+    def cache_stats(self) -> dict:
+        '''Статистика кэшей уровня модуля index.py (_visible у modules и т. п.)'''
+        cache = sys.modules.get('shared.cache')
+        if self.module is None or cache is None:
+            return {}
+        return {name: value.stats() for name, value in vars(self.module).items() if isinstance(value, cache.TTLCache)}
+
+
+class Gateway:
+    def __init__(self, names: list, workers: int):
+        for name in names:
+            directory = os.path.join(BACKEND, name)
+            if directory not in sys.path:
+                sys.path.insert(0, directory)
+        self.functions = {name: Function(name) for name in names}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='handler')
+        self.shared_mtimes = source_mtimes(SHARED)
+        self._reload_lock = threading.Lock()
+
+    def load_all(self) -> None:
+        with self._reload_lock:
+            for function in self.functions.values():
+                function.load()
+
+    def reload_changed(self) -> None:
+        with self._reload_lock:
+            shared_mtimes = source_mtimes(SHARED)
+            if shared_mtimes != self.shared_mtimes:
+                self.shared_mtimes = shared_mtimes
+                print('[devserver] shared/ changed, reloading all functions', flush=True)
+                self._drop_shared()
+                for function in self.functions.values():
+                    function.load()
+                return
+            for function in self.functions.values():
+                if function.changed():
+                    print(f'[devserver] {function.name} changed, reloading', flush=True)
+                    function.load()
+
+    @staticmethod
+    def _drop_shared() -> None:
+        db = sys.modules.get('shared.db')
+        pool = getattr(db, '_pool', None)
+        if pool is not None:
+            pool.close_all()
+        for name in [name for name in sys.modules if name == 'shared' or name.startswith('shared.')]:
+            del sys.modules[name]
+
+    async def watch(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(None, self.reload_changed)
+
+    async def tick(self, name: str, interval: float) -> None:
+        '''Вызывает функцию событием таймер-триггера раз в interval секунд'''
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            function = self.functions[name]
+            if function.handler is None:
+                continue
+            request_id = uuid.uuid4().hex
+            event = {'messages': [{
+                'event_metadata': {'event_id': request_id, 'event_type': TIMER_EVENT_TYPE},
+                'details': {'trigger_id': 'devserver'}
+            }]}
+            started = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(self.executor, function.handler, event, Context(request_id, name))
+            except Exception:
+                print(traceback.format_exc(), file=sys.stderr, flush=True)
+                continue
+            print(f'[devserver] timer {name} -> {result.get("statusCode")} {result.get("body")} '
+                  f'{(time.perf_counter() - started) * 1000:.1f} ms', flush=True)
+
+    async def invoke(self, request: web.Request) -> web.Response:
+        name = request.match_info['function']
+        function = self.functions.get(name)
+        if function is None:
+            return web.json_response({'error': f'Unknown function {name}'}, status=404)
+        if function.handler is None:
+            return web.json_response({'error': f'{name} failed to load', 'traceback': function.load_error}, status=500)
+
+        body = await request.read()
+        request_id = uuid.uuid4().hex
+        event = self.event(request, body, request_id)
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, function.handler, event, Context(request_id, name))
+        except Exception:
+            print(traceback.format_exc(), file=sys.stderr, flush=True)
+            return web.json_response({'error': 'Unhandled exception in handler'}, status=502)
+
+        print(f'[devserver] {request.method} {request.path_qs} -> {result.get("statusCode")} '
+              f'{(time.perf_counter() - started) * 1000:.1f} ms', flush=True)
+        return self.response(result)
+
+    @staticmethod
+    def event(request: web.Request, body: bytes, request_id: str) -> dict:
+        '''HTTP-запрос в event шлюза: заголовки в каноническом регистре, первые значения query'''
+        headers = {}
+        for key, value in request.headers.items():
+            key = '-'.join(part.capitalize() for part in key.split('-'))
+            headers[key] = f'{headers[key]}, {value}' if key in headers else value
+
+        is_base64 = False
+        text = None
+        if body:
+            try:
+                text = body.decode('utf-8')
+            except UnicodeDecodeError:
+                text, is_base64 = base64.b64encode(body).decode('ascii'), True
+
+        peer = request.transport.get_extra_info('peername') if request.transport else None
+        return {
+            'httpMethod': request.method,
+            'path': '/' + request.match_info.get('tail', ''),
+            'headers': headers,
+            'queryStringParameters': {key: request.query.get(key) for key in request.query.keys()},
+            'body': text,
+            'isBase64Encoded': is_base64,
+            'requestContext': {
+                'requestId': request_id,
+                'httpMethod': request.method,
+                'identity': {'sourceIp': peer[0] if peer else None}
+            }
+        }
+
+    @staticmethod
+    def response(result: dict) -> web.Response:
+        body = result.get('body') or ''
+        if result.get('isBase64Encoded'):
+            payload = base64.b64decode(body)
+        else:
+            payload = body.encode('utf-8') if isinstance(body, str) else body
+        return web.Response(status=result.get('statusCode', 200), headers=result.get('headers') or {}, body=payload)
+
+    async def stats(self, request: web.Request) -> web.Response:
+        '''Тёплое состояние процесса: пул, подготовленные запросы, кэши'''
+        data = {
+            'functions': {
+                name: {
+                    'loaded': function.handler is not None,
+                    'loadedAt': function.loaded_at,
+                    'error': function.load_error,
+                    'caches': function.cache_stats()
+                }
+                for name, function in self.functions.items()
+            }
+        }
+        db = sys.modules.get('shared.db')
+        if getattr(db, '_pool', None) is not None:
+            data['pool'] = db._pool.stats()
+        for key, module_name, attr in (
+            ('queries', 'shared.queries', 'stats'),
+            ('tokens', 'shared.tokens', 'cache_stats')
+        ):
+            module = sys.modules.get(module_name)
+            if module is not None:
+                data[key] = getattr(module, attr)()
+        return web.json_response(data)
+
+    def make_app(self, watch_interval: float, timers: bool = False) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_get('/_dev/stats', self.stats)
+        app.router.add_route('*', '/{function}', self.invoke)
+        app.router.add_route('*', '/{function}/{tail:.*}', self.invoke)
+
+        async def start_watcher(app: web.Application):
+            tasks = [asyncio.create_task(self.watch(watch_interval))] if watch_interval > 0 else []
+            if timers:
+                tasks += [
+                    asyncio.create_task(self.tick(name, interval))
+                    for name, interval in TIMERS.items() if name in self.functions
+                ]
+            yield
+            for task in tasks:
+                task.cancel()
+            self.executor.shutdown(wait=False)
+
+        app.cleanup_ctx.append(start_watcher)
+        return app
+
+
+def discover() -> list:
+    return sorted(
+        os.path.basename(os.path.dirname(path))
+        for path in glob.glob(os.path.join(BACKEND, '*', 'index.py'))
+        if os.path.basename(os.path.dirname(path)) != 'shared'
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=8, help='сколько вызовов handler() выполнять одновременно')
+    parser.add_argument('--functions', help='через запятую; по умолчанию все backend/*/index.py')
+    parser.add_argument('--watch-interval', type=float, default=1.0, help='опрос файлов, сек; 0 — без перезагрузки')
+    parser.add_argument('--timers', action='store_true', help='вызывать функции из TIMERS по их расписанию')
+    args = parser.parse_args()
+
+    if args.dsn:
+        os.environ['DATABASE_URL'] = args.dsn
+    names = args.functions.split(',') if args.functions else discover()
+    gateway = Gateway(names, args.workers)
+    gateway.load_all()
+    for name in names:
+        print(f'[devserver] {name:<14} http://{args.host}:{args.port}/{name}', flush=True)
+    web.run_app(gateway.make_app(args.watch_interval, args.timers), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
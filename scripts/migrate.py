@@ -0,0 +1,342 @@
+'''Применяет db_migrations/V*.sql с учётом уже применённых версий и запускает фоновые backfill-ы
+
+    python scripts/migrate.py --dsn postgresql://...                # миграции, затем backfill-ы
+    python scripts/migrate.py --dsn ... --status                     # что применено и что осталось
+    python scripts/migrate.py --dsn ... --baseline V0008             # отметить уже применённые вручную
+    python scripts/migrate.py --dsn ... --batch-size 500 --max-rate 2000 --pause 0.1
+
+Файл с CONCURRENTLY в командах (упоминание в комментарии «--» не считается) выполняется вне
+транзакции, по одной команде: каждая команда в нём должна быть идемпотентной (IF NOT EXISTS),
+а невалидный индекс от прерванного CREATE INDEX CONCURRENTLY удаляется перед повтором.
+Остальные файлы применяются одной транзакцией вместе с записью версии.
+
+Backfill — модуль scripts/backfills/B*.py с AFTER (версия миграции), remaining(cursor) и
+batch(cursor, position, size) -> (строк, новая позиция). Каждая пачка коммитится вместе с позицией
+в schema_backfills, поэтому прерванный backfill продолжается с места остановки.
+'''
+import argparse
+import glob
+import hashlib
+import importlib.util
+import os
+import re
+import sys
+import time
+from typing import Iterator, List, Optional
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(ROOT, 'db_migrations')
+BACKFILLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backfills')
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+
+LOCK_ID = 0x57a77e  # pg_advisory_lock: один раннер на базу
+
+_CONCURRENTLY = re.compile(r'\bCONCURRENTLY\b', re.IGNORECASE)
+_CREATE_INDEX = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?("?[\w.]+"?)', re.IGNORECASE
+)
+
+BOOTSTRAP = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version VARCHAR(20) PRIMARY KEY,
+        name VARCHAR(200) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        duration_ms INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS schema_backfills (
+        name VARCHAR(200) PRIMARY KEY,
+        position TEXT,
+        rows_done BIGINT NOT NULL DEFAULT 0,
+        started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        completed_at TIMESTAMPTZ
+    );
+"""
+
+
+class Migration:
+    __slots__ = ('version', 'name', 'path', 'sql', 'checksum')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.version = self.name.split('__', 1)[0]
+        with open(path, encoding='utf-8') as f:
+            self.sql = f.read()
+        self.checksum = hashlib.sha256(self.sql.encode('utf-8')).hexdigest()
+
+    @property
+    def concurrent(self) -> bool:
+        '''CONCURRENTLY в самих командах; упоминание в комментарии «--» файл вне транзакции не выносит'''
+        return any(_CONCURRENTLY.search(statement) for statement in split_statements(self.sql))
+
+
+def discover() -> List[Migration]:
+    return [Migration(path) for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, 'V*__*.sql')))]
+
+
+def discover_backfills() -> list:
+    modules = []
+    for path in sorted(glob.glob(os.path.join(BACKFILLS_DIR, 'B*__*.py'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(f'backfill_{name}', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.NAME = name
+        modules.append(module)
+    return modules
+
+
+def split_statements(sql: str) -> Iterator[str]:
+    '''Команды файла по «;» вне строк и комментариев (без $$-тел функций)'''
+    statement, quote, i = [], False, 0
+    while i < len(sql):
+        char = sql[i]
+        if quote:
+            statement.append(char)
+            if char == "'":
+                quote = False
+        elif char == "'":
+            quote = True
+            statement.append(char)
+        elif sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = len(sql) if end < 0 else end
+            continue
+        elif char == ';':
+            text = ''.join(statement).strip()
+            if text:
+                yield text
+            statement = []
+        else:
+            statement.append(char)
+        i += 1
+    text = ''.join(statement).strip()
+    if text:
+        yield text
+
+
+def applied(conn) -> dict:
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT version, checksum FROM schema_migrations")
+        rows = dict(cursor.fetchall())
+    conn.commit()
+    return rows
+
+
+def record(cursor, migration: Migration, started: float) -> None:
+    cursor.execute("""
+        INSERT INTO schema_migrations (version, name, checksum, duration_ms) VALUES (%s, %s, %s, %s)
+    """, (migration.version, migration.name, migration.checksum, int((time.perf_counter() - started) * 1000)))
+
+
+def drop_invalid_index(cursor, statement: str) -> None:
+    '''Прерванный CREATE INDEX CONCURRENTLY оставляет INVALID индекс, и IF NOT EXISTS его не пересоздаст'''
+    match = _CREATE_INDEX.search(statement)
+    if not match:
+        return
+    name = match.group(1).strip('"')
+    cursor.execute("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid
+    """, (name,))
+    if cursor.fetchone():
+        print(f'  dropping invalid index {name}', flush=True)
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+def apply(conn, migration: Migration, lock_timeout: str) -> None:
+    started = time.perf_counter()
+    if not migration.concurrent:
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+            cursor.execute(migration.sql)
+            record(cursor, migration, started)
+        conn.commit()
+        return
+
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET lock_timeout = %s", (lock_timeout,))
+            for statement in split_statements(migration.sql):
+                drop_invalid_index(cursor, statement)
+                cursor.execute(statement)
+            record(cursor, migration, started)
+    finally:
+        conn.autocommit = False
+
+
+def migrate(conn, lock_timeout: str = '5s', verbose: bool = True) -> int:
+    '''Применяет недостающие версии по порядку; возвращает их число'''
+    done = applied(conn)
+    count = 0
+    for migration in discover():
+        if migration.version in done:
+            if done[migration.version] != migration.checksum and verbose:
+                print(f'warning: {migration.name} changed after it was applied', flush=True)
+            continue
+        if verbose:
+            mode = ' (concurrently)' if migration.concurrent else ''
+            print(f'applying {migration.name}{mode}', flush=True)
+        apply(conn, migration, lock_timeout)
+        count += 1
+    return count
+
+
+def baseline(conn, version: str) -> None:
+    '''Отмечает версии до version включительно как применённые, не выполняя их'''
+    with conn.cursor() as cursor:
+        for migration in discover():
+            if migration.version > version:
+                break
+            cursor.execute("""
+                INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)
+                ON CONFLICT (version) DO NOTHING
+            """, (migration.version, migration.name, migration.checksum))
+    conn.commit()
+
+
+def run_backfill(conn, module, batch_size: int, pause: float, max_rate: Optional[float]) -> None:
+    '''Пачки до пустой; между пачками — пауза и ограничение строк в секунду
+
+    Завершённый backfill проверяется заново через remaining(): пока старый код ещё работает
+    (миграции идут до деплоя), он может снова записать строки, и тогда проход начинается с начала.
+    '''
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO schema_backfills (name) VALUES (%s)
+            ON CONFLICT (name) DO UPDATE SET updated_at = now()
+            RETURNING position, rows_done, completed_at
+        """, (module.NAME,))
+        position, rows_done, completed_at = cursor.fetchone()
+        total = module.remaining(cursor)
+        if completed_at and total:
+            cursor.execute("""
+                UPDATE schema_backfills SET position = NULL, completed_at = NULL, updated_at = now()
+                WHERE name = %s
+            """, (module.NAME,))
+            print(f'backfill {module.NAME}: reopened, {total} rows appeared after completion', flush=True)
+            position = None
+    conn.commit()
+    if completed_at and not total:
+        return
+
+    print(f'backfill {module.NAME}: {total} rows left, resuming after {position!r}', flush=True)
+    started = time.perf_counter()
+    processed = 0
+    while True:
+        batch_started = time.perf_counter()
+        with conn.cursor() as cursor:
+            rows, position = module.batch(cursor, position, batch_size)
+            cursor.execute("""
+                UPDATE schema_backfills
+                SET position = %s, rows_done = rows_done + %s, updated_at = now(),
+                    completed_at = CASE WHEN %s = 0 THEN now() END
+                WHERE name = %s
+            """, (position, rows, rows, module.NAME))
+        conn.commit()
+        if not rows:
+            break
+
+        processed += rows
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed else 0.0
+        progress = f'{processed}/{total}' if total else str(processed)
+        eta = f', eta {(total - processed) / rate:.0f}s' if total and rate and total > processed else ''
+        print(f'  {module.NAME}: {progress} rows, {rate:.0f} rows/s, '
+              f'batch {(time.perf_counter() - batch_started) * 1000:.0f} ms{eta}', flush=True)
+
+        delay = pause
+        if max_rate:
+            delay = max(delay, rows / max_rate - (time.perf_counter() - batch_started))
+        if delay > 0:
+            time.sleep(delay)
+
+    print(f'backfill {module.NAME}: done, {processed} rows in {time.perf_counter() - started:.1f}s', flush=True)
+
+
+def ensure_audit_partitions(conn, months_ahead: int = 12) -> None:
+    '''Досоздаёт месячные секции audit_log при каждом запуске, а не только при применении V0009'''
+    if 'V0009' not in applied(conn):
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT ensure_audit_partitions(%s)", (months_ahead,))
+        created = cursor.fetchone()[0]
+    conn.commit()
+    if created:
+        print(f'audit_log: {created} partitions created', flush=True)
+
+
+def run_backfills(conn, batch_size: int, pause: float, max_rate: Optional[float]) -> None:
+    done = applied(conn)
+    for module in discover_backfills():
+        if module.AFTER not in done:
+            print(f'backfill {module.NAME}: waiting for {module.AFTER}', flush=True)
+            continue
+        run_backfill(conn, module, batch_size, pause, max_rate)
+
+
+def status(conn) -> None:
+    done = applied(conn)
+    for migration in discover():
+        state = 'applied' if migration.version in done else 'pending'
+        if migration.version in done and done[migration.version] != migration.checksum:
+            state = 'changed'
+        print(f'{migration.name:<55} {state}')
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name, rows_done, position, completed_at FROM schema_backfills")
+        backfills = {row[0]: row[1:] for row in cursor.fetchall()}
+    conn.commit()
+    for module in discover_backfills():
+        rows_done, position, completed_at = backfills.get(module.NAME, (0, None, None))
+        state = 'done' if completed_at else f'{rows_done} rows, position {position!r}'
+        print(f'{module.NAME:<55} {state}')
+
+
+def connect(dsn: str):
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cursor:
+        cursor.execute(BOOTSTRAP)
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (LOCK_ID,))
+        locked = cursor.fetchone()[0]
+    conn.commit()
+    if not locked:
+        conn.close()
+        raise SystemExit('another migration runner holds the lock')
+    return conn
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--status', action='store_true')
+    parser.add_argument('--baseline', metavar='VERSION')
+    parser.add_argument('--skip-backfills', action='store_true')
+    parser.add_argument('--lock-timeout', default='5s', help='сколько DDL ждёт блокировку, прежде чем сдаться')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--pause', type=float, default=0.0, help='пауза между пачками backfill, сек')
+    parser.add_argument('--max-rate', type=float, help='не больше строк backfill в секунду')
+    args = parser.parse_args()
+
+    conn = connect(args.dsn)
+    try:
+        if args.status:
+            status(conn)
+            return
+        if args.baseline:
+            baseline(conn, args.baseline)
+        count = migrate(conn, args.lock_timeout)
+        print(f'{count} migrations applied', flush=True)
+        ensure_audit_partitions(conn)
+        if not args.skip_backfills:
+            run_backfills(conn, args.batch_size, args.pause, args.max_rate)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()